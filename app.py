@@ -7,87 +7,320 @@ import dataframe_image as dfi  # pip install dataframe_image
 from PIL import Image
 import io
 import base64
-import matplotlib.pyplot as plt
+import csv
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta
+import openpyxl
+import time
+import threading
+import zipfile
+import importlib
+import atexit
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.font_manager import FontProperties
 
-def safe_parse_float(value):
+# Bảng quy đổi điểm theo từng trường: (điểm thang 10 tối thiểu, thang 4, thang chữ)
+GRADE_SCALES = {
+    "Tín chỉ (A+ → F)": [
+        (0.0, 0.0, "F"),
+        (4.0, 1.0, "D"),
+        (5.0, 1.5, "D+"),
+        (5.5, 2.0, "C"),
+        (6.5, 2.5, "C+"),
+        (7.0, 3.0, "B"),
+        (8.0, 3.5, "B+"),
+        (8.5, 3.7, "A"),
+        (9.0, 4.0, "A+"),
+    ],
+    "Tín chỉ (A → F)": [
+        (0.0, 0.0, "F"),
+        (4.0, 1.0, "D"),
+        (5.0, 1.5, "D+"),
+        (5.5, 2.0, "C"),
+        (6.5, 2.5, "C+"),
+        (7.0, 3.0, "B"),
+        (8.0, 3.5, "B+"),
+        (8.5, 4.0, "A"),
+    ],
+    "Bộ GD&ĐT (A, B, C, D, F)": [
+        (0.0, 0.0, "F"),
+        (4.0, 1.0, "D"),
+        (5.5, 2.0, "C"),
+        (7.0, 3.0, "B"),
+        (8.5, 4.0, "A"),
+    ],
+}
+DEFAULT_GRADE_SCALE = "Tín chỉ (A+ → F)"
+
+@st.cache_resource(show_spinner=False)
+def get_grade_lookup_tables():
+    """Build the cutoff/point/letter arrays for every grade scale once per process"""
+    tables = {}
+    for name, rows in GRADE_SCALES.items():
+        rows = sorted(rows)
+        tables[name] = (
+            np.array([r[0] for r in rows], dtype=float),
+            np.array([r[1] for r in rows], dtype=float),
+            np.array([r[2] for r in rows], dtype=object),
+        )
+    return tables
+
+def fill_derived_grades(df, scale=DEFAULT_GRADE_SCALE):
+    """Fill missing 'Thang 4' / 'Thang chữ' from 'Thang 10' for the whole column at once"""
+    if df.empty or 'Thang 10' not in df.columns:
+        return df
+    cutoffs, points, letters = get_grade_lookup_tables()[scale]
+
+    score_10 = df['Thang 10'].to_numpy(dtype=float, na_value=np.nan)
+    has_score = ~np.isnan(score_10)
+    # Vị trí bậc điểm của mỗi dòng: bậc cuối cùng có ngưỡng <= điểm thang 10
+    grade_idx = np.clip(np.searchsorted(cutoffs, np.where(has_score, score_10, 0.0), side='right') - 1,
+                        0, len(cutoffs) - 1)
+
+    df = df.copy()
+    missing_4 = has_score & df['Thang 4'].isna().to_numpy()
+    if missing_4.any():
+        df['Thang 4'] = df['Thang 4'].astype(float)
+        df.loc[missing_4, 'Thang 4'] = points[grade_idx[missing_4]]
+
+    letter = df['Thang chữ']
+    missing_letter = has_score & (letter.isna() | (letter.astype(str).str.strip() == '')).to_numpy()
+    if missing_letter.any():
+        df['Thang chữ'] = letter.astype(object)
+        df.loc[missing_letter, 'Thang chữ'] = letters[grade_idx[missing_letter]]
+    return df
+
+# Số dòng đọc mỗi lần khi nạp tệp lớn, và số cột tối đa của một dòng dữ liệu
+UPLOAD_CHUNK_ROWS = 20000
+MAX_INPUT_COLUMNS = 32
+
+def _read_delimited_chunks(source, sep, quoting=csv.QUOTE_MINIMAL):
+    """Read a delimited text source in chunks of positional string columns"""
+    return pd.read_csv(
+        source,
+        sep=sep,
+        header=None,
+        names=range(MAX_INPUT_COLUMNS),
+        dtype=str,
+        keep_default_na=False,
+        quoting=quoting,
+        skip_blank_lines=True,
+        on_bad_lines='skip',
+        encoding='utf-8-sig',
+        engine='c',
+        chunksize=UPLOAD_CHUNK_ROWS,
+    )
+
+def _read_text_chunks(text):
+    """Read pasted tab-separated text with the same chunked reader as uploads"""
+    text = text.strip()
+    if not text:
+        return []
+    return _read_delimited_chunks(io.StringIO(text), '\t', quoting=csv.QUOTE_NONE)
+
+def _read_xlsx_chunks(source):
+    """Read the first worksheet of an XLSX file in chunks using openpyxl's read-only mode"""
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
     try:
-        return float(value) if value and value.strip() else None
-    except ValueError:
-        return None
+        batch = []
+        for values in workbook.worksheets[0].iter_rows(values_only=True):
+            batch.append(['' if v is None else str(v) for v in values[:MAX_INPUT_COLUMNS]])
+            if len(batch) >= UPLOAD_CHUNK_ROWS:
+                yield pd.DataFrame(batch).reindex(columns=range(MAX_INPUT_COLUMNS), fill_value='')
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch).reindex(columns=range(MAX_INPUT_COLUMNS), fill_value='')
+    finally:
+        workbook.close()
 
-def parse_input_data(text):
-    rows = []
-    for line in text.strip().split('\n'):
-        parts = line.split('\t')
-        try:
-            row = {
-                'Kỳ/Năm học': parts[1],
-                'Mã lớp học phần': parts[3],
-                'Tên lớp học phần': parts[4],
-                'Số TC': float(parts[5]) if parts[5] else 0,
-                'Công thức điểm': parts[6],
-                'BT': safe_parse_float(parts[7]),
-                'GK': safe_parse_float(parts[8]),
-                'CK': safe_parse_float(parts[9]),
-                'QT': safe_parse_float(parts[10]) if len(parts) > 10 else None,
-                'TN': safe_parse_float(parts[11]) if len(parts) > 11 else None,
-                'Thang 10': safe_parse_float(parts[12]) if len(parts) > 12 else None,
-                'Thang 4': safe_parse_float(parts[13]) if len(parts) > 13 else None,
-                'Thang chữ': parts[14] if len(parts) > 14 else None
-            }
-            # Làm tròn các giá trị số về 1 số sau dấu phẩy
-            for key in ['BT', 'GK', 'CK', 'QT', 'TN', 'Thang 10', 'Thang 4']:
-                if row[key] is not None:
-                    row[key] = round(row[key], 1)
-            rows.append(row)
-        except (IndexError, ValueError):
-            continue
+def _field_count_consistency(lines, sep):
+    """Share of lines having the most common field count for a delimiter; 0 if that count is 1"""
+    counts = pd.Series([len(fields) for fields in csv.reader(lines, delimiter=sep)])
+    if counts.empty or counts.mode().iloc[0] < 2:
+        return 0.0
+    return float((counts == counts.mode().iloc[0]).mean())
 
-    df = pd.DataFrame(rows)
-    df.insert(0, 'STT', range(1, len(df) + 1))
+def sniff_upload_format(head, name=None):
+    """Guess the format of an uploaded file from its first bytes: 'xlsx', '\\t' or ','
+
+    Delimited files are told apart by the extension when it is '.tsv', otherwise by which delimiter
+    gives the same field count on most complete lines. Raw comma counts are not enough: the
+    timetable's own time column ("Thứ 2,1-4,P301 (Tuần 1-8,10-12)") is full of commas.
+    """
+    if head.startswith(b'PK\x03\x04'):
+        return 'xlsx'
+    if name and name.lower().endswith('.tsv'):
+        return '\t'
+    lines = head.decode('utf-8-sig', errors='ignore').splitlines()
+    # Dòng cuối có thể bị cắt ngang ở giới hạn số byte đọc
+    if len(lines) > 1:
+        lines = lines[:-1]
+    lines = [line for line in lines if line.strip()]
+    # Hòa thì ưu tiên tab, định dạng khi copy bảng từ trang web
+    return '\t' if _field_count_consistency(lines, '\t') >= _field_count_consistency(lines, ',') else ','
+
+def iter_upload_chunks(file):
+    """Yield positional string chunks from an uploaded CSV, TSV or XLSX file"""
+    file.seek(0)
+    head = file.read(4096)
+    file.seek(0)
+    fmt = sniff_upload_format(head, getattr(file, 'name', None))
+    if fmt == 'xlsx':
+        return _read_xlsx_chunks(file)
+    return _read_delimited_chunks(file, fmt)
+
+def hash_uploaded_file(file):
+    """Content hash of an uploaded file, used as the cache key for its parsed result"""
+    return hashlib.sha256(file.getbuffer()).hexdigest()
+
+def hash_pasted_text(text):
+    """Content hash of a pasted timetable, so pasted and uploaded sources share one kind of cache key"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _clean_column(raw, col):
+    return raw[col].fillna('').str.strip()
+
+def _transcript_frame_from_raw(raw):
+    """Map positional transcript columns to the transcript schema for a whole chunk at once"""
+    credits_text = _clean_column(raw, 5)
+    credits = pd.to_numeric(credits_text, errors='coerce')
+    code = _clean_column(raw, 3)
+    # Bỏ các dòng tiêu đề/ngăn cách: không có mã lớp hoặc số tín chỉ không hợp lệ
+    valid = (code != '') & (credits.notna() | (credits_text == ''))
+    raw = raw[valid]
+
+    df = pd.DataFrame({
+        'Kỳ/Năm học': _clean_column(raw, 1),
+        'Mã lớp học phần': code[valid],
+        'Tên lớp học phần': _clean_column(raw, 4),
+        'Số TC': credits[valid].fillna(0).astype(float),
+        'Công thức điểm': _clean_column(raw, 6),
+    })
+    # Làm tròn các giá trị số về 1 số sau dấu phẩy
+    for key, col in [('BT', 7), ('GK', 8), ('CK', 9), ('QT', 10), ('TN', 11), ('Thang 10', 12), ('Thang 4', 13)]:
+        df[key] = pd.to_numeric(_clean_column(raw, col), errors='coerce').round(1)
+    df['Thang chữ'] = _clean_column(raw, 14).replace('', None)
     return df
 
+def _finish_transcript_frame(frames, scale):
+    df = pd.concat(frames, ignore_index=True) if frames else _transcript_frame_from_raw(
+        pd.DataFrame(columns=range(MAX_INPUT_COLUMNS), dtype=str))
+    df.insert(0, 'STT', range(1, len(df) + 1))
+    # Bổ sung thang 4 / thang chữ còn thiếu từ thang 10
+    return fill_derived_grades(df, scale)
+
+def parse_input_data(text, scale=DEFAULT_GRADE_SCALE):
+    return _finish_transcript_frame([_transcript_frame_from_raw(raw) for raw in _read_text_chunks(text)], scale)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_transcript_upload(file_hash, _file, scale=DEFAULT_GRADE_SCALE):
+    """Parse an uploaded transcript file; cached by content hash so re-uploads are free"""
+    return _finish_transcript_frame([_transcript_frame_from_raw(raw) for raw in iter_upload_chunks(_file)], scale)
+
+# Một buổi học trong cột thời gian, ví dụ "Thứ 2,1-4,P301" hoặc "Thứ 6,1-3,P305 (A2)",
+# kèm tuần học tùy chọn "Thứ 2,1-4,P301 (Tuần 1-8,10-12)". Dấu "(" chỉ kết thúc tên phòng khi mở mục "Tuần".
+SESSION_PATTERN = re.compile(
+    r'(?:Thứ\s*(?P<day>[2-7])|(?P<sunday>CN|Chủ\s*nhật))\s*,\s*(?:Tiết\s*)?(?P<start>\d{1,2})\s*-\s*(?P<end>\d{1,2})'
+    r'(?:\s*,\s*(?P<room>(?:[^,;\n(]|\((?!\s*Tuần))*?))?'
+    r'(?:\s*[,(]?\s*Tuần\s*:?\s*(?P<weeks>\d[\d\s,\-]*\d|\d)\s*\)?)?'
+    r'(?=\s*(?:[,;\n]|$))',
+    re.IGNORECASE
+)
+WEEKDAYS = ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "CN"]
+SESSION_COLUMNS = ['STT', 'Mã học phần', 'Tên lớp học phần', 'Giảng viên', 'Thứ', 'Tiết', 'Phòng',
+                   'day_idx', 'period_start', 'period_end', 'Tuần']
+
+def _sessions_frame(course, day_idx, period_start, period_end, room, weeks):
+    day = np.array(WEEKDAYS, dtype=object)[day_idx]
+    periods = pd.Series(period_start).astype(str) + '-' + pd.Series(period_end).astype(str)
+    sessions = course.reset_index(drop=True).reindex(columns=['STT', 'Mã học phần', 'Tên lớp học phần', 'Giảng viên'],
+                                                     fill_value='')
+    sessions['Thứ'] = day
+    sessions['Tiết'] = periods
+    sessions['Phòng'] = np.asarray(room, dtype=object)
+    sessions['day_idx'] = day_idx
+    sessions['period_start'] = period_start
+    sessions['period_end'] = period_end
+    sessions['Tuần'] = np.asarray(weeks, dtype=object)
+    return sessions
+
+def extract_sessions(tt_df):
+    """One row per weekly session with integer day/periods, extracted from 'Lịch học' in a single regex pass"""
+    if tt_df.empty or 'Lịch học' not in tt_df.columns:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    found = tt_df['Lịch học'].str.extractall(SESSION_PATTERN)
+    if found.empty:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+
+    # Thứ 2 → 0, ..., Thứ 7 → 5, CN → 6
+    day_idx = (pd.to_numeric(found['day'], errors='coerce') - 2).fillna(6).astype(int).to_numpy()
+    return _sessions_frame(
+        tt_df.loc[found.index.get_level_values(0)],
+        day_idx,
+        found['start'].astype(int).to_numpy(),
+        found['end'].astype(int).to_numpy(),
+        found['room'].fillna('').str.strip().to_numpy(dtype=object),
+        found['weeks'].to_numpy(dtype=object),
+    )
+
+def custom_course_sessions(custom_courses):
+    """Custom courses as weekly sessions that meet every week of the semester"""
+    if not custom_courses:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    courses = pd.DataFrame(custom_courses)
+    return _sessions_frame(
+        pd.DataFrame({'Tên lớp học phần': courses['course_name']}),
+        courses['day'].map(WEEKDAYS.index).to_numpy(),
+        courses['period_start'].to_numpy(dtype=int),
+        courses['period_end'].to_numpy(dtype=int),
+        courses['room'].to_numpy(dtype=object),
+        [None] * len(courses),
+    )
+
+def _timetable_frame_from_raw(raw):
+    """Map positional timetable columns to one row per weekly session for a whole chunk at once"""
+    # Bỏ dòng "Tổng cộng:" và các dòng không có thông tin thời gian
+    is_total = raw.apply(lambda col: col.str.contains("Tổng cộng:", regex=False, na=False)).any(axis=1)
+    time_info = _clean_column(raw, 7)
+    raw = raw[~is_total & (time_info != '')]
+
+    courses = pd.DataFrame({
+        'STT': _clean_column(raw, 0),
+        'Mã học phần': _clean_column(raw, 1),
+        'Tên lớp học phần': _clean_column(raw, 2),
+        'Giảng viên': _clean_column(raw, 6),
+        'Lịch học': time_info[raw.index]  # Toàn bộ lịch học, có thể gồm nhiều buổi và tuần học
+    }).reset_index(drop=True)
+    # Tách "Thứ 2,1-4,P3, Thứ 5,7-9,P5" thành từng buổi với thứ/tiết là số nguyên
+    return extract_sessions(courses)
+
+def _finish_timetable_frame(frames):
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
 def parse_timetable_data(text):
-    rows = []
-    for line in text.strip().split('\n'):
-        if "Tổng cộng:" in line:
-            continue
-        parts = line.split('\t')
-        try:
-            if len(parts) < 8:
-                continue
-                
-            # Extract time and room information
-            time_info = parts[7].strip()
-            time_parts = time_info.split(',')
-            
-            # Initialize variables
-            day = ""
-            periods = ""
-            room = ""
-            
-            if len(time_parts) >= 3:
-                day = time_parts[0].strip()  # e.g., "Thứ 2"
-                periods = time_parts[1].strip()  # e.g., "1-4"
-                room = time_parts[2].strip()  # e.g., "P3"
-            
-            row = {
-                'STT': parts[0].strip(),
-                'Mã học phần': parts[1].strip(),
-                'Tên lớp học phần': parts[2].strip(),
-                'Giảng viên': parts[6].strip(),
-                'Thứ': day,
-                'Tiết': periods,
-                'Phòng': room,
-                'Thời gian': f"{day},{periods}"  # Keep original format for timetable generation
-            }
-            
-            if row['Thời gian']:
-                rows.append(row)
-        except Exception as e:
-            continue
-            
-    return pd.DataFrame(rows)
+    return _finish_timetable_frame([_timetable_frame_from_raw(raw) for raw in _read_text_chunks(text)])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_timetable_upload(file_hash, _file):
+    """Parse an uploaded timetable file; cached by content hash so re-uploads are free"""
+    return _finish_timetable_frame([_timetable_frame_from_raw(raw) for raw in iter_upload_chunks(_file)])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_timetable_sessions(source_key, _text, _file=None):
+    """Weekly sessions of the uploaded or pasted timetable, cached by source so the input is parsed once"""
+    if _file is not None:
+        return load_timetable_upload(source_key, _file)
+    return parse_timetable_data(_text)
 
 # Chuyển đổi từ giờ phút sang tiết học
 def time_to_period(hour, minute):
@@ -134,118 +367,257 @@ def time_to_period(hour, minute):
     return 1
 
 def generate_timetable(df, custom_courses=None):
-    # Tạo danh sách thời gian chính xác
-    time_slots = [
-        "07:00 → 07:50",
-        "08:00 → 08:50",
-        "09:00 → 09:50",
-        "10:00 → 10:50",
-        "11:00 → 11:50",
-        "12:30 → 13:20",
-        "13:30 → 14:20",
-        "14:30 → 15:20",
-        "15:30 → 16:20",
-        "16:30 → 17:20",
-        "17:30 → 18:15",
-        "18:15 → 19:00",
-        "19:10 → 19:55",
-        "19:55 → 20:40"
-    ]
-    
-    timetable = pd.DataFrame(
-        index=time_slots,
-        columns=["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "CN"]
-    )
-    
-    # Dictionary ánh xạ tiết học với index thời gian
-    period_to_time = {
-        1: "07:00 → 07:50",
-        2: "08:00 → 08:50",
-        3: "09:00 → 09:50",
-        4: "10:00 → 10:50",
-        5: "11:00 → 11:50",
-        6: "12:30 → 13:20",
-        7: "13:30 → 14:20",
-        8: "14:30 → 15:20",
-        9: "15:30 → 16:20",
-        10: "16:30 → 17:20",
-        11: "17:30 → 18:15",
-        12: "18:15 → 19:00",
-        13: "19:10 → 19:55",
-        14: "19:55 → 20:40"
-    }
-    
-    # Keep track of which time slots are used
-    used_time_slots = set()
-    
-    for _, row in df.iterrows():
-        class_time = row.get("Thời gian")
-        room = row.get("Phòng", "")
-        if class_time:
-            parts = class_time.split(',')
-            if len(parts) >= 2:
-                day = parts[0].strip()
-                time_range_str = parts[1].strip()
-                try:
-                    period_start, period_end = map(int, time_range_str.split('-'))
-                    for period in range(period_start, period_end + 1):
-                        if period in period_to_time:
-                            time_slot = period_to_time[period]
-                            used_time_slots.add(time_slot)  # Mark this time slot as used
-                            if day in timetable.columns and time_slot in timetable.index:
-                                class_info = f"{row['Tên lớp học phần']}"
-                                if room:
-                                    class_info += f"\n{room}"
-                                if pd.isna(timetable.at[time_slot, day]) or timetable.at[time_slot, day] == "":
-                                    timetable.at[time_slot, day] = class_info
-                                else:
-                                    timetable.at[time_slot, day] = f"{timetable.at[time_slot, day]}\n{class_info}"
-                except:
-                    continue
-    
-    # Add custom courses if provided
+    """Weekly grid (time slot × weekday) built from the integer day/period columns of the sessions"""
+    start_times, end_times = get_time_mappings()
+    time_slots = [f"{start} → {end}" for start, end in zip(start_times, end_times)]
+
+    # Thêm các môn tự tạo như những buổi học bình thường
     if custom_courses:
-        for course in custom_courses:
-            day = course['day']
-            # Chuyển đổi giờ bắt đầu và kết thúc sang tiết học
-            period_start = course['period_start']
-            period_end = course['period_end']
-            course_name = course['course_name']
-            room = course['room']
-            
-            for period in range(period_start, period_end + 1):
-                if period in period_to_time:
-                    time_slot = period_to_time[period]
-                    used_time_slots.add(time_slot)  # Mark this time slot as used
-                    if day in timetable.columns and time_slot in timetable.index:
-                        class_info = f"{course_name}"
-                        if room:
-                            class_info += f"\n{room}"
-                        if pd.isna(timetable.at[time_slot, day]) or timetable.at[time_slot, day] == "":
-                            timetable.at[time_slot, day] = class_info
-                        else:
-                            timetable.at[time_slot, day] = f"{timetable.at[time_slot, day]}\n{class_info}"
-    
-    # Filter to only include used time slots
-    if used_time_slots:
-        # Sort time slots to maintain correct order
-        used_time_slots = sorted(list(used_time_slots), key=lambda x: time_slots.index(x))
-        timetable = timetable.loc[used_time_slots]
-    else:
-        # If no time slots are used, return an empty dataframe with the correct structure
-        timetable = pd.DataFrame(columns=timetable.columns)
-    
-    # Điền các ô trống bằng chuỗi rỗng thay vì NaN
-    timetable = timetable.fillna("")
+        df = pd.concat([df, custom_course_sessions(custom_courses)], ignore_index=True)
+    if df.empty:
+        return pd.DataFrame(columns=WEEKDAYS)
+
+    day_idx = df['day_idx'].to_numpy(dtype=int)
+    period_start = df['period_start'].to_numpy(dtype=int)
+    period_end = df['period_end'].to_numpy(dtype=int)
+    room = df['Phòng'].fillna('').astype(str).to_numpy(dtype=object)
+    labels = df['Tên lớp học phần'].astype(str).to_numpy(dtype=object) + np.where(room != '', '\n' + room, '')
+
+    # Mỗi buổi học trải ra thành từng tiết: buổi i lặp lại (period_end - period_start + 1) lần
+    lengths = np.maximum(period_end - period_start + 1, 0)
+    owner = np.repeat(np.arange(len(df)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    period = period_start[owner] + offsets
+    valid = (period >= 1) & (period <= len(time_slots)) & (day_idx[owner] >= 0) & (day_idx[owner] < len(WEEKDAYS))
+    if not valid.any():
+        return pd.DataFrame(columns=WEEKDAYS)
+
+    cells = pd.DataFrame({'period': period[valid], 'day': day_idx[owner][valid], 'label': labels[owner][valid]})
+    # Các môn trùng ô được nối theo thứ tự xuất hiện, chỉ giữ các khung giờ có học
+    timetable = cells.groupby(['period', 'day'], sort=True)['label'].agg('\n'.join).unstack('day')
+    timetable = timetable.reindex(columns=range(len(WEEKDAYS))).fillna("")
+    timetable.index = [time_slots[p - 1] for p in timetable.index]
+    timetable.columns = WEEKDAYS
     return timetable
 
 def validate_timetable_data(df):
-    required_columns = ['Tên lớp học phần', 'Thời gian']
+    required_columns = ['Tên lớp học phần', 'day_idx', 'period_start', 'period_end']
     missing_columns = [col for col in required_columns if col not in df.columns]
     if missing_columns:
         raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
     return True
 
+def parse_week_spec(spec, n_weeks):
+    """Week numbers from a spec like '1-8,10-12'; an empty spec means every week of the semester"""
+    if not isinstance(spec, str) or not spec.strip():
+        return np.arange(1, n_weeks + 1)
+    weeks = set()
+    for part in re.sub(r'\s*-\s*', '-', spec).replace(',', ' ').split():
+        try:
+            if '-' in part:
+                first, last = part.split('-', 1)
+                weeks.update(range(int(first), int(last) + 1))
+            else:
+                weeks.add(int(part))
+        except ValueError:
+            continue
+    return np.array(sorted(w for w in weeks if 1 <= w <= n_weeks), dtype=int)
+
+def _period_minutes():
+    """Start and end minute of day for each period, indexed by period number (index 0 unused)"""
+    start_times, end_times = get_time_mappings()
+    to_minutes = lambda t: int(t[:2]) * 60 + int(t[3:])
+    return (np.array([0] + [to_minutes(t) for t in start_times]),
+            np.array([0] + [to_minutes(t) for t in end_times]))
+
+def build_schedule_index(sessions, semester_start, n_weeks):
+    """Expand weekly sessions over the semester calendar into occurrences sorted by start time
+
+    Week 1 is the Monday-based week containing `semester_start`; occurrences before that date are dropped.
+    """
+    sessions = sessions.reset_index(drop=True)
+    monday = np.datetime64(semester_start - timedelta(days=semester_start.weekday())).astype('datetime64[m]')
+
+    # Mỗi chuỗi tuần học chỉ được phân tích một lần
+    week_specs = {}
+    week_lists = [week_specs.setdefault(spec, parse_week_spec(spec, n_weeks)) for spec in sessions['Tuần']]
+    counts = np.array([len(w) for w in week_lists], dtype=int)
+    weeks = np.concatenate(week_lists) if week_lists else np.empty(0, dtype=int)
+    positions = np.repeat(np.arange(len(sessions)), counts)
+
+    start_minutes, end_minutes = _period_minutes()
+    day_offset = ((weeks - 1) * 7 + sessions['day_idx'].to_numpy(dtype=int)[positions]) * 1440
+    period_start = np.clip(sessions['period_start'].to_numpy(dtype=int)[positions], 1, 14)
+    period_end = np.clip(sessions['period_end'].to_numpy(dtype=int)[positions], 1, 14)
+    starts = monday + (day_offset + start_minutes[period_start]).astype('timedelta64[m]')
+    ends = monday + (day_offset + end_minutes[period_end]).astype('timedelta64[m]')
+
+    # Tuần 1 là tuần chứa ngày bắt đầu; bỏ các buổi rơi vào trước ngày đó
+    in_semester = starts >= np.datetime64(semester_start, 'D')
+    starts, ends, positions = starts[in_semester], ends[in_semester], positions[in_semester]
+
+    order = np.argsort(starts, kind='stable')
+    return {
+        'starts': starts[order],
+        'ends': ends[order],
+        'session_pos': positions[order],
+        'sessions': sessions,
+        'monday': monday,
+        'n_weeks': n_weeks,
+    }
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def get_schedule_index(sessions_hash, semester_start, n_weeks, _sessions):
+    """Cached schedule index, keyed by the sessions hash and the semester calendar"""
+    return build_schedule_index(_sessions, semester_start, n_weeks)
+
+def hash_sessions(sessions):
+    """Content hash of a sessions frame, used as the cache key for its schedule index"""
+    return hashlib.sha256(pd.util.hash_pandas_object(sessions.astype(str), index=False).to_numpy().tobytes()).hexdigest()
+
+def _occurrences(schedule, lo, hi):
+    sessions = schedule['sessions'].iloc[schedule['session_pos'][lo:hi]]
+    result = sessions[['Thứ', 'Tiết', 'Tên lớp học phần', 'Phòng', 'Giảng viên']].reset_index(drop=True)
+    result.insert(0, 'Bắt đầu', pd.to_datetime(schedule['starts'][lo:hi]))
+    result.insert(1, 'Kết thúc', pd.to_datetime(schedule['ends'][lo:hi]))
+    return result
+
+def classes_between(schedule, start, end):
+    """Occurrences starting in [start, end), found with two binary searches"""
+    lo = np.searchsorted(schedule['starts'], np.datetime64(start, 'm'), side='left')
+    hi = np.searchsorted(schedule['starts'], np.datetime64(end, 'm'), side='left')
+    return _occurrences(schedule, lo, hi)
+
+def classes_on_date(schedule, day):
+    start = datetime.combine(day, datetime.min.time())
+    return classes_between(schedule, start, start + timedelta(days=1))
+
+def next_class(schedule, now):
+    """The first occurrence starting at or after `now`, or None if the semester is over"""
+    i = np.searchsorted(schedule['starts'], np.datetime64(now, 'm'), side='left')
+    if i >= len(schedule['starts']):
+        return None
+    return _occurrences(schedule, i, i + 1).iloc[0]
+
+def week_of(schedule, day):
+    """Semester week number (1-based) that contains `day`"""
+    return int((np.datetime64(day, 'D') - schedule['monday'].astype('datetime64[D]')).astype(int) // 7) + 1
+
+def week_sessions(schedule, week):
+    """Sessions that meet in the given semester week, ready for generate_timetable"""
+    start = schedule['monday'] + np.timedelta64((week - 1) * 7, 'D')
+    lo = np.searchsorted(schedule['starts'], start, side='left')
+    hi = np.searchsorted(schedule['starts'], start + np.timedelta64(7, 'D'), side='left')
+    return schedule['sessions'].iloc[np.unique(schedule['session_pos'][lo:hi])]
+
+# Lưới tuần 7 ngày × 14 tiết: mỗi ngày là một mặt nạ bit, bit 0 ứng với tiết 1
+PERIODS_PER_DAY = 14
+FULL_DAY_MASK = (1 << PERIODS_PER_DAY) - 1
+
+def period_span_masks(period_start, period_end):
+    """Bitmask covering periods [period_start, period_end] for whole arrays at once"""
+    start = np.clip(np.asarray(period_start, dtype=np.int64), 1, PERIODS_PER_DAY)
+    end = np.clip(np.asarray(period_end, dtype=np.int64), 1, PERIODS_PER_DAY)
+    masks = np.left_shift(1, end) - np.left_shift(1, start - 1)
+    return np.where(end >= start, masks, 0).astype(np.uint16)
+
+def popcount(masks):
+    """Number of set periods in each uint16 day mask"""
+    masks = np.ascontiguousarray(masks, dtype=np.uint16)
+    return np.unpackbits(masks.view(np.uint8).reshape(masks.shape + (2,)), axis=-1).sum(axis=-1)
+
+def build_occupancy_index(sessions, key_column):
+    """Inverted index from a room or lecturer to its (7 days,) occupancy bitmasks, built in one pass"""
+    keys = sessions[key_column].fillna('').astype(str).str.strip()
+    valid = (keys != '').to_numpy()
+    codes, labels = pd.factorize(keys[valid], sort=True)
+    masks = np.zeros((len(labels), 7), dtype=np.uint16)
+    day_idx = sessions['day_idx'].to_numpy(dtype=int)[valid]
+    spans = period_span_masks(sessions['period_start'].to_numpy(dtype=int)[valid],
+                              sessions['period_end'].to_numpy(dtype=int)[valid])
+    # Gộp mọi buổi học của cùng một phòng/giảng viên trong cùng ngày bằng phép OR
+    np.bitwise_or.at(masks, (codes, day_idx), spans)
+    return {
+        'keys': np.asarray(labels, dtype=object),
+        'masks': masks,
+        'positions': {key: i for i, key in enumerate(labels)},
+    }
+
+def free_keys(index, day_idx, period_start, period_end):
+    """Rooms (or lecturers) with nothing scheduled on a day over a period range"""
+    query = period_span_masks(period_start, period_end)
+    return index['keys'][(index['masks'][:, day_idx] & query) == 0]
+
+def weekly_load(index):
+    """Number of occupied periods per week for every key of the index"""
+    return pd.Series(popcount(index['masks']).sum(axis=1), index=index['keys'], name='Số tiết/tuần')
+
+def mask_to_grid(day_masks, label="x"):
+    """Grid in the generate_timetable layout with `label` in every set period"""
+    start_times, end_times = get_time_mappings()
+    bits = (day_masks[None, :] >> np.arange(PERIODS_PER_DAY)[:, None]) & 1
+    grid = pd.DataFrame(np.where(bits == 1, label, ''),
+                        index=[f"{s} → {e}" for s, e in zip(start_times, end_times)],
+                        columns=WEEKDAYS)
+    return grid[(grid != '').any(axis=1)]
+
+def combined_sources_key(source_hashes):
+    """Order-independent cache key for a set of sources, given their content hashes"""
+    # Ngăn cách bằng \0 để các bộ khóa khác nhau không thể ghép thành cùng một chuỗi
+    return hashlib.sha256('\0'.join(sorted(source_hashes)).encode()).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def get_occupancy_indexes(sources_key, _sources):
+    """Room and lecturer occupancy indexes for (file hash, file) pairs, cached by their combined key"""
+    sessions = pd.concat([load_timetable_sessions(h, None, f) for h, f in _sources], ignore_index=True)
+    return build_occupancy_index(sessions, 'Phòng'), build_occupancy_index(sessions, 'Giảng viên')
+
+def group_busy_masks(member_sessions):
+    """(members, 7) busy bitmask matrix built in one pass over every member's sessions"""
+    busy = np.zeros((len(member_sessions), 7), dtype=np.uint16)
+    sizes = [len(s) for s in member_sessions]
+    if sum(sizes) == 0:
+        return busy
+    sessions = pd.concat(member_sessions, ignore_index=True)
+    member = np.repeat(np.arange(len(member_sessions)), sizes)
+    spans = period_span_masks(sessions['period_start'].to_numpy(dtype=int), sessions['period_end'].to_numpy(dtype=int))
+    np.bitwise_or.at(busy, (member, sessions['day_idx'].to_numpy(dtype=int)), spans)
+    return busy
+
+def group_free_counts(busy):
+    """Number of free members for every (day, period) slot, as a (7, 14) array"""
+    free = ~busy & FULL_DAY_MASK
+    bits = (free[:, :, None] >> np.arange(PERIODS_PER_DAY, dtype=np.uint16)) & 1
+    return bits.sum(axis=0)
+
+def rank_free_blocks(free_counts, min_free):
+    """Contiguous blocks where at least `min_free` members are free, longest first"""
+    available = np.pad((free_counts >= min_free).astype(np.int8), ((0, 0), (1, 1)))
+    edges = np.diff(available, axis=1)
+    # np.argwhere duyệt theo hàng nên điểm bắt đầu và kết thúc của từng khoảng luôn khớp nhau
+    starts = np.argwhere(edges == 1)
+    ends = np.argwhere(edges == -1)[:, 1]
+
+    start_times, end_times = get_time_mappings()
+    blocks = pd.DataFrame({
+        'Thứ': [WEEKDAYS[d] for d in starts[:, 0]],
+        'Từ tiết': starts[:, 1] + 1,
+        'Đến tiết': ends,
+        'Thời gian': [f"{start_times[s]} → {end_times[e - 1]}" for s, e in zip(starts[:, 1], ends)],
+        'Số tiết': ends - starts[:, 1],
+        'Số thành viên rảnh': [int(free_counts[d, s:e].min()) for (d, s), e in zip(starts, ends)],
+    })
+    return blocks.sort_values(['Số tiết', 'Số thành viên rảnh'], ascending=False, kind='stable').reset_index(drop=True)
+
+def split_pasted_timetables(text):
+    """Pasted timetables of several members, separated by a line containing only '---'"""
+    return [part for part in re.split(r'^\s*---\s*$', text, flags=re.MULTILINE) if part.strip()]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def get_group_busy_masks(sources_key, _sources):
+    """Busy masks for (cache key, text, file) sources, cached by their combined key"""
+    return group_busy_masks([load_timetable_sessions(key, text, file) for key, text, file in _sources])
+
 def get_classification(gpa_4):
     if gpa_4 >= 3.6:
         return "Xuất sắc"
@@ -260,23 +632,76 @@ def get_classification(gpa_4):
     else:
         return "Kém"
 
-def calculate_gpa(df):
+# Cách tính các môn học lại: tất cả các lần, lần điểm cao nhất hoặc lần học gần nhất
+RETAKE_POLICIES = {
+    "Tất cả các lần học": "all",
+    "Lần có điểm cao nhất": "best",
+    "Lần học gần nhất": "latest",
+}
+
+def course_stems(codes):
+    """Course code without the class-section suffix, e.g. 'INT1001 2' or 'INT1001-02' -> 'INT1001'"""
+    codes = codes.fillna('').astype(str).str.strip().str.upper()
+    stems = codes.str.extract(r'^([^\W\d_]+\s*\d+[^\W\d_]?)', expand=False)
+    return stems.fillna(codes).str.replace(r'\s+', '', regex=True)
+
+def build_course_index(df):
+    """Hash map from course stem to row positions of the transcript"""
+    stems = course_stems(df['Mã lớp học phần'])
+    return {
+        'stems': stems.to_numpy(),
+        'by_course': stems.groupby(stems.to_numpy(), sort=False).indices,
+    }
+
+def gpa_rows_mask(df):
+    """Rows that can count towards GPA: both scores present and a positive 'Số TC'"""
+    return ((df['Thang 10'].notna()) & (df['Thang 4'].notna()) & (df['Số TC'] > 0)).to_numpy()
+
+def lookup_course(df, course_index, code):
+    """All attempts of a course, found through the index instead of scanning the transcript"""
+    stem = course_stems(pd.Series([code])).iloc[0]
+    positions = course_index['by_course'].get(stem, np.empty(0, dtype=int))
+    return df.iloc[positions]
+
+def retake_mask(df, policy="all", course_index=None):
+    """Boolean mask of the rows counted towards GPA under a retake policy
+
+    'best' keeps the highest 'Thang 10' attempt of each course (the later one on ties),
+    'latest' keeps the last graded attempt in transcript order. Only rows that can count towards
+    GPA compete, so a blank or 0-credit attempt never replaces a real one; other rows are left as is.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if policy == "all" or df.empty:
+        return mask
+    if course_index is None:
+        course_index = build_course_index(df)
+
+    attempts = pd.DataFrame({
+        'stem': course_index['stems'],
+        'score': df['Thang 10'].to_numpy(dtype=float, na_value=np.nan),
+        'pos': np.arange(len(df)),
+    })
+    attempts = attempts[gpa_rows_mask(df)]
+    if policy == "best":
+        attempts = attempts.sort_values(['score', 'pos'], kind='stable')
+    superseded = attempts['pos'].to_numpy()[attempts.duplicated('stem', keep='last').to_numpy()]
+    mask[superseded] = False
+    return mask
+
+def calculate_gpa(df, retake_policy="all", course_index=None):
     try:
-        valid_courses = df[
-            (df['Thang 10'].notna()) & 
-            (df['Thang chữ'].notna()) & 
-            (df['Số TC'] > 0)
-        ]
-        total_credits = valid_courses['Số TC'].sum()
+        valid_courses = df[retake_mask(df, retake_policy, course_index) & gpa_rows_mask(df)]
+        # Làm tròn tổng để sai số cộng dồn không làm lệch kết quả so với bảng GPA theo kỳ
+        total_credits = np.round(valid_courses['Số TC'].sum(), 6)
         if total_credits == 0:
             return 0, 0, 'N/A', 0
 
-        total_points_10 = (valid_courses['Số TC'] * valid_courses['Thang 10']).sum()
-        total_points_4 = (valid_courses['Số TC'] * valid_courses['Thang 4']).sum()
+        total_points_10 = np.round((valid_courses['Số TC'] * valid_courses['Thang 10']).sum(), 6)
+        total_points_4 = np.round((valid_courses['Số TC'] * valid_courses['Thang 4']).sum(), 6)
 
         # Changed rounding to 2 decimal places
-        gpa_10 = round(total_points_10 / total_credits, 2)
-        gpa_4 = round(total_points_4 / total_credits, 2)
+        gpa_10 = np.round(total_points_10 / total_credits, 2)
+        gpa_4 = np.round(total_points_4 / total_credits, 2)
 
         classification = get_classification(gpa_4)
 
@@ -285,6 +710,61 @@ def calculate_gpa(df):
         st.error(f"Lỗi khi tính GPA: {e}")
         return 0, 0, 'N/A', 0
 
+def hash_transcript(df):
+    """Content hash of a parsed transcript, used as the cache key for derived results"""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+def compute_gpa_timeline(df, retake_policy="all", course_index=None):
+    """Semester and cumulative GPA in transcript order
+
+    Semester GPA counts every graded attempt taken that semester. Cumulative GPA after a semester
+    applies the retake policy only to attempts up to that semester, so later retakes never rewrite it.
+    """
+    graded = gpa_rows_mask(df)
+    if course_index is None:
+        course_index = build_course_index(df)
+    credits = df['Số TC'].to_numpy(dtype=float, na_value=np.nan)
+    attempts = pd.DataFrame({
+        'Kỳ/Năm học': df['Kỳ/Năm học'].to_numpy(),
+        'stem': course_index['stems'],
+        'score': df['Thang 10'].to_numpy(dtype=float, na_value=np.nan),
+        'credits': credits,
+        'points_10': credits * df['Thang 10'].to_numpy(dtype=float, na_value=np.nan),
+        'points_4': credits * df['Thang 4'].to_numpy(dtype=float, na_value=np.nan),
+    })[graded]
+    values = ['credits', 'points_10', 'points_4']
+    sums = attempts.groupby('Kỳ/Năm học', sort=False)[values].sum().round(6)
+
+    # Mỗi lần học được tính sẽ thay thế lần được tính trước đó của cùng môn: cộng phần chênh lệch
+    if retake_policy == "all":
+        changes = attempts
+    else:
+        counted = attempts
+        if retake_policy == "best":
+            # Chỉ tính khi không thấp hơn điểm cao nhất trước đó (bằng điểm thì lấy lần sau)
+            best_before = attempts.groupby('stem')['score'].cummax().groupby(attempts['stem']).shift(1)
+            counted = attempts[best_before.isna() | (attempts['score'] >= best_before)]
+        replaced = counted.groupby('stem')[values].shift(1).fillna(0)
+        changes = counted[['Kỳ/Năm học']].join(counted[values] - replaced)
+    # Tử số và mẫu số tích lũy sau mỗi kỳ
+    cumulative = changes.groupby('Kỳ/Năm học', sort=False)[values].sum().reindex(sums.index, fill_value=0).cumsum()
+    # Cùng cách làm tròn với calculate_gpa để kỳ cuối luôn khớp
+    cumulative = cumulative.round(6)
+
+    return pd.DataFrame({
+        'Số TC': sums['credits'],
+        'GPA kỳ (Thang 10)': (sums['points_10'] / sums['credits']).round(2),
+        'GPA kỳ (Thang 4)': (sums['points_4'] / sums['credits']).round(2),
+        'TC tích lũy': cumulative['credits'],
+        'GPA tích lũy (Thang 10)': (cumulative['points_10'] / cumulative['credits']).round(2),
+        'GPA tích lũy (Thang 4)': (cumulative['points_4'] / cumulative['credits']).round(2),
+    })
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_gpa_timeline(transcript_hash, retake_policy, _df, _course_index=None):
+    """Cached GPA timeline, keyed by the transcript hash so chart interactions don't recompute it"""
+    return compute_gpa_timeline(_df, retake_policy, _course_index)
+
 def calculate_required_gpa(current_gpa, current_credits, total_program_credits, target_gpa):
     """
     Calculate the required GPA for remaining courses to achieve the target GPA
@@ -309,6 +789,72 @@ def calculate_required_gpa(current_gpa, current_credits, total_program_credits,
     
     return round(required_gpa, 2), remaining_credits
 
+# Khung chương trình đào tạo, nạp một lần và dùng chung cho mọi phiên.
+# Không có sẵn dữ liệu: đặt tệp curriculum.json cạnh app.py (xem curriculum.example.json)
+# hoặc chỉ đường dẫn bằng biến môi trường CURRICULUM_PATH.
+CURRICULUM_PATH = os.environ.get(
+    "CURRICULUM_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "curriculum.json"))
+DEFAULT_PROGRAM_CREDITS = 180
+
+@st.cache_resource(show_spinner=False)
+def get_curriculum_catalog(path=CURRICULUM_PATH):
+    """Curriculum programs and courses indexed by program code and course stem
+
+    Loaded once per process and shared read-only by all sessions; empty when the file is missing.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+
+    def stems(codes):
+        return list(course_stems(pd.Series(list(codes), dtype=object)))
+
+    courses = {}
+    for course, code in zip(data.get('courses', []), stems(c['code'] for c in data.get('courses', []))):
+        courses[code] = {
+            'code': code,
+            'name': course.get('name', ''),
+            'credits': float(course.get('credits', 0)),
+            'prerequisites': frozenset(stems(course.get('prerequisites', []))),
+            'programs': [],
+        }
+
+    programs = {}
+    for program in data.get('programs', []):
+        codes = tuple(stems(program.get('courses', [])))
+        unknown = [code for code in codes if code not in courses]
+        if unknown:
+            raise ValueError(f"Unknown courses in program {program['code']}: {', '.join(unknown)}")
+        for code in codes:
+            courses[code]['programs'].append(program['code'])
+        programs[program['code']] = {
+            'code': program['code'],
+            'name': program.get('name', ''),
+            'courses': codes,
+            'course_set': frozenset(codes),
+            'total_credits': float(program.get('total_credits', sum(courses[code]['credits'] for code in codes))),
+        }
+    return {'programs': programs, 'courses': courses}
+
+def completed_course_stems(df, course_index=None):
+    """Stems of the transcript's 'Mã lớp học phần' values with at least one passing attempt"""
+    stems = course_index['stems'] if course_index is not None else course_stems(df['Mã lớp học phần']).to_numpy()
+    passed = df['Thang 4'].to_numpy(dtype=float, na_value=np.nan) > 0
+    return frozenset(stems[passed])
+
+def remaining_courses(catalog, program_code, completed):
+    """Required courses of a program not passed yet, in program order, with missing prerequisites"""
+    program = catalog['programs'][program_code]
+    remaining = [catalog['courses'][code] for code in program['courses'] if code not in completed]
+    return pd.DataFrame({
+        'Mã học phần': [course['code'] for course in remaining],
+        'Tên học phần': [course['name'] for course in remaining],
+        'Số TC': [course['credits'] for course in remaining],
+        'Tiên quyết chưa đạt': [', '.join(sorted(course['prerequisites'] - completed)) for course in remaining],
+    })
+
 def style_timetable_for_export(df, theme="light"):
     """Create a styled version of the timetable for export"""
     # Define colors based on theme
@@ -381,112 +927,280 @@ def style_timetable_for_export(df, theme="light"):
     
     return styled
 
+# Họ phông chữ dùng cho ảnh xuất, truyền theo từng lần vẽ thay vì sửa plt.rcParams toàn cục
+EXPORT_FONT_FAMILY = ['Segoe UI', 'Arial', 'DejaVu Sans', 'Verdana', 'Helvetica', 'sans-serif']
+
+def get_export_colors(theme="light"):
+    """Colors of the exported timetable image for a theme"""
+    if theme == "dark":
+        return {
+            'header': '#1E293B',   # Dark blue
+            'alt_row': '#334155',  # Dark blue-gray
+            'row': '#1E293B',      # Dark blue
+            'border': '#475569',   # Medium gray
+            'text': '#F1F5F9',     # Light gray/white
+            'background': '#0F172A',  # Very dark blue
+            'title': '#F1F5F9',    # Light gray/white
+        }
+    return {
+        'header': '#4472C4',   # Professional blue
+        'alt_row': '#EDF2F7',  # Light blue/gray
+        'row': '#F8FAFC',      # Very light blue
+        'border': '#BFBFBF',   # Medium gray
+        'text': '#333333',     # Dark gray
+        'background': 'white', # White
+        'title': '#333333',    # Dark gray
+    }
+
+def build_table_figure(n_rows, n_cols, theme="light"):
+    """Build a styled, empty table figure on the object-oriented Agg API (no pyplot state)"""
+    colors = get_export_colors(theme)
+    cell_font = FontProperties(family=EXPORT_FONT_FAMILY, size=10)
+    label_font = FontProperties(family=EXPORT_FONT_FAMILY, size=10, weight='bold')
+    header_font = FontProperties(family=EXPORT_FONT_FAMILY, size=11, weight='bold')
+
+    figure = Figure(figsize=(16, 10), dpi=150)
+    FigureCanvasAgg(figure)
+    figure.patch.set_facecolor(colors['background'])
+    ax = figure.add_subplot()
+    ax.axis('off')
+
+    table = ax.table(
+        cellText=[[''] * n_cols for _ in range(n_rows)],
+        rowLabels=[''] * n_rows,
+        colLabels=[''] * n_cols,
+        cellLoc='center',
+        loc='center',
+        bbox=[0, 0, 1, 1]
+    )
+    table.auto_set_font_size(False)
+    table.set_fontsize(10)
+    table.scale(1.2, 1.8)
+
+    cells = table.get_celld()
+    for (i, j), cell in cells.items():
+        if i == 0:
+            cell.set_facecolor(colors['header'])
+            font = header_font
+        elif j == -1:
+            cell.set_facecolor(colors['header'])
+            font = label_font
+        else:
+            cell.set_facecolor(colors['alt_row'] if i % 2 == 0 else colors['row'])
+            font = cell_font
+        cell.get_text().set_fontproperties(font)
+        cell.get_text().set_color(colors['text'])
+        # Add a subtle grid effect
+        cell.set_edgecolor(colors['border'])
+        cell.set_linewidth(0.5)
+
+    figure.suptitle('Thời Khóa Biểu', y=0.98, color=colors['title'],
+                    fontproperties=FontProperties(family=EXPORT_FONT_FAMILY, size=20, weight='bold'))
+    return {'figure': figure, 'cells': cells, 'background': colors['background']}
+
+# Đo hàng đợi vẽ ảnh phía máy chủ; khi đặt biến môi trường RENDER_STATS_PATH, mỗi lần thay đổi
+# được ghi ra tệp JSON đó để load_test.py đọc
+RENDER_STATS_PATH = os.environ.get("RENDER_STATS_PATH")
+
+@st.cache_resource(show_spinner=False)
+def get_render_stats():
+    """Process-wide render queue gauges shared by all sessions"""
+    return {'lock': threading.Lock(), 'since': time.perf_counter(), 'gauges': {}}
+
+def track_render_queue(gauge, delta):
+    """Move a render queue gauge by `delta`, keeping its peak, total entries and depth × time area"""
+    stats = get_render_stats()
+    with stats['lock']:
+        now = time.perf_counter()
+        g = stats['gauges'].setdefault(gauge, {'current': 0, 'max': 0, 'entered': 0, 'area': 0.0, 'last': now})
+        g['area'] += g['current'] * (now - g['last'])
+        g['last'] = now
+        g['current'] += delta
+        g['max'] = max(g['max'], g['current'])
+        g['entered'] += max(delta, 0)
+        # Tiến trình vẽ hàng loạt cũng gọi hàm này nhưng không được ghi đè số liệu của máy chủ
+        if RENDER_STATS_PATH and multiprocessing.parent_process() is None:
+            snapshot = {'elapsed': now - stats['since'],
+                        'gauges': {name: {k: v for k, v in values.items() if k != 'last'}
+                                   for name, values in stats['gauges'].items()}}
+            tmp_path = f"{RENDER_STATS_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, RENDER_STATS_PATH)
+
 def export_table_to_png(df, theme="light"):
-    """Export DataFrame to PNG with styling based on theme and improved fonts"""
+    """Export DataFrame to PNG with styling based on theme and improved fonts
+
+    Each call builds its own figure, so concurrent sessions never share matplotlib state and
+    the Agg buffer is freed together with the figure once the call returns.
+    Renders in progress are counted on the 'renders' gauge of get_render_stats.
+    """
+    track_render_queue('renders', 1)
     try:
-        # Define colors based on theme
-        if theme == "dark":
-            header_color = '#1E293B'  # Dark blue
-            alt_row_color = '#334155'  # Dark blue-gray
-            row_color = '#1E293B'      # Dark blue
-            border_color = '#475569'   # Medium gray
-            text_color = '#F1F5F9'     # Light gray/white
-            bg_color = '#0F172A'       # Very dark blue
-            title_color = '#F1F5F9'    # Light gray/white
-        else:  # Light theme
-            header_color = '#4472C4'   # Professional blue
-            alt_row_color = '#EDF2F7'  # Light blue/gray
-            row_color = '#F8FAFC'      # Very light blue
-            border_color = '#BFBFBF'   # Medium gray
-            text_color = '#333333'     # Dark gray
-            bg_color = 'white'         # White
-            title_color = '#333333'    # Dark gray
-        
-        # Set up better fonts
-        plt.rcParams['font.family'] = 'sans-serif'
-        plt.rcParams['font.sans-serif'] = ['Segoe UI', 'Arial', 'DejaVu Sans', 'Verdana', 'Helvetica']
-        
-        # Use matplotlib for better control over the image generation
-        fig, ax = plt.subplots(figsize=(16, 10), dpi=150)
-        ax.axis('off')
-        fig.patch.set_facecolor(bg_color)  # Set figure background
-        
-        # Create and style table
-        cell_text = []
-        for i in range(len(df)):
-            cell_text.append(df.iloc[i].tolist())
-            
-        table = ax.table(
-            cellText=cell_text,
-            rowLabels=df.index,
-            colLabels=df.columns,
-            cellLoc='center',
-            loc='center',
-            bbox=[0, 0, 1, 1]
-        )
-        
-        # Style the table
-        table.auto_set_font_size(False)
-        table.set_fontsize(10)  # Slightly larger font
-        table.scale(1.2, 1.8)
-        
-        # Style headers with better fonts
-        for j, key in enumerate(df.columns):
-            table[(0, j)].set_facecolor(header_color)
-            table[(0, j)].set_text_props(color=text_color, fontweight='bold', 
-                                        family='sans-serif', size=11)  # Improved header font
-        
-        # Style row labels (time slots) with better fonts
-        for i, key in enumerate(df.index):
-            table[(i+1, -1)].set_facecolor(header_color)
-            table[(i+1, -1)].set_text_props(color=text_color, fontweight='bold', 
-                                          family='sans-serif', size=10)  # Improved label font
-        
-        # Style cells with better fonts
-        for i in range(len(df)):
-            for j in range(len(df.columns)):
-                if i % 2 == 1:
-                    table[(i+1, j)].set_facecolor(alt_row_color)
-                else:
-                    table[(i+1, j)].set_facecolor(row_color)
-                # Improved cell font
-                table[(i+1, j)].set_text_props(color=text_color, family='sans-serif', size=10,
-                                             weight='normal', style='normal')
-                
-                # Add padding to cell text for better readability
-                cell = table[(i+1, j)]
-                cell_text = cell.get_text().get_text()
-                if '\n' in cell_text:
-                    # Improve line spacing for multi-line text
-                    lines = cell_text.split('\n')
-                    formatted_text = '\n'.join([line.strip() for line in lines])
-                    cell.get_text().set_text(formatted_text)
-        
-        # Add title with better font
-        plt.suptitle('Thời Khóa Biểu', fontsize=20, fontweight='bold', 
-                   family='sans-serif', y=0.98, color=title_color)
-        
-        # Add a subtle grid effect
-        for pos, cell in table._cells.items():
-            cell.set_edgecolor(border_color)
-            cell.set_linewidth(0.5)  # Thinner borders for cleaner look
-        
+        table = build_table_figure(len(df), len(df.columns), theme)
+        cells = table['cells']
+        for j, column in enumerate(df.columns):
+            cells[(0, j)].get_text().set_text(str(column))
+        for i, label in enumerate(df.index):
+            cells[(i + 1, -1)].get_text().set_text(str(label))
+        for i, row in enumerate(df.itertuples(index=False), start=1):
+            for j, value in enumerate(row):
+                # Improve line spacing for multi-line text
+                text = '' if value is None or (isinstance(value, float) and np.isnan(value)) else str(value)
+                cells[(i, j)].get_text().set_text('\n'.join(line.strip() for line in text.split('\n')))
+
         # Save to bytes with better quality
         buf = io.BytesIO()
-        plt.savefig(buf, format='png', 
-                   bbox_inches='tight',
-                   pad_inches=0.5,
-                   facecolor=bg_color,
-                   edgecolor='none',
-                   dpi=300)
-        plt.close()
-        buf.seek(0)
+        table['figure'].savefig(buf, format='png',
+                                bbox_inches='tight',
+                                pad_inches=0.5,
+                                facecolor=table['background'],
+                                edgecolor='none',
+                                dpi=300)
         return buf.getvalue()
-            
+
     except Exception as e:
         st.error(f"Error exporting table: {str(e)}")
         st.exception(e)
         return None
+    finally:
+        track_render_queue('renders', -1)
+
+# Xuất ảnh thời khóa biểu hàng loạt: mỗi lưới khác nhau chỉ vẽ một lần
+def hash_timetable_grid(grid, theme="light"):
+    """Content hash of a generated grid and its theme; students with the same schedule share one render"""
+    return hashlib.sha256(f"{theme}\n{grid.to_csv()}".encode('utf-8')).hexdigest()
+
+def batch_entry_name(position, name):
+    """ZIP entry name for a student, prefixed with its position so names never collide"""
+    stem = re.sub(r'[^\w\-]+', '_', os.path.splitext(name)[0]).strip('_') or 'sinh_vien'
+    return f"{position:03d}_{stem}.png"
+
+def _render_batch_job(job):
+    """Worker entry point: (grid hash, grid, theme) → (grid hash, PNG bytes)"""
+    grid_hash, grid, theme = job
+    return grid_hash, export_table_to_png(grid, theme)
+
+# Số tiến trình vẽ tối đa cho cả máy chủ, có thể đặt lại bằng biến môi trường RENDER_WORKERS
+MAX_RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 4))
+# Tệp ZIP của các phiên đã bỏ đi được xóa sau khoảng thời gian này (giây)
+BATCH_ZIP_TTL = 3600
+
+def render_worker_count():
+    """CPUs this process may actually run on (container/affinity aware), capped at MAX_RENDER_WORKERS"""
+    if hasattr(os, 'sched_getaffinity'):
+        available = len(os.sched_getaffinity(0))
+    else:
+        available = os.cpu_count() or 1
+    return max(1, min(available, MAX_RENDER_WORKERS))
+
+@st.cache_resource(show_spinner=False)
+def get_render_pool():
+    """Worker processes shared by all sessions; each imports the renderer once"""
+    # Không fork tiến trình Streamlit đang chạy nhiều luồng
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=render_worker_count(), mp_context=multiprocessing.get_context(method))
+
+@st.cache_resource(show_spinner=False)
+def get_batch_zip_dir():
+    """Temp directory holding every session's batch ZIP; removed when the server process exits"""
+    path = tempfile.mkdtemp(prefix="tkb_batch_")
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+def new_batch_zip_path(old_path=None):
+    """Fresh ZIP path for a session, deleting its previous ZIP and any left behind by abandoned sessions"""
+    directory = get_batch_zip_dir()
+    if old_path and os.path.exists(old_path):
+        os.remove(old_path)
+    cutoff = time.time() - BATCH_ZIP_TTL
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    fd, path = tempfile.mkstemp(suffix=".zip", dir=directory)
+    os.close(fd)
+    return path
+
+def iter_batch_renders(jobs, parallel=None):
+    """Yield (grid hash, PNG) as each job finishes, keeping at most 2 jobs per worker in flight"""
+    n_workers = render_worker_count()
+    if parallel is None:
+        parallel = n_workers > 1 and len(jobs) > 1
+    if not parallel:
+        for job in jobs:
+            yield _render_batch_job(job)
+        return
+
+    # Streamlit chạy app.py dưới tên __main__, tiến trình con cần import hàm vẽ từ module app
+    render = importlib.import_module(os.path.splitext(os.path.basename(__file__))[0])._render_batch_job
+    pool = get_render_pool()
+    pending = set()
+    try:
+        for job in jobs:
+            pending.add(pool.submit(render, job))
+            track_render_queue('batch_pending', 1)
+            if len(pending) >= 2 * n_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                track_render_queue('batch_pending', -len(done))
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            pending.discard(future)
+            track_render_queue('batch_pending', -1)
+            yield future.result()
+    except BrokenProcessPool:
+        # Một worker bị dừng đột ngột: lần sau tạo lại pool mới
+        get_render_pool.clear()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+        track_render_queue('batch_pending', -len(pending))
+
+def build_batch_zip(students, zip_path, theme="light", parallel=None, on_progress=None):
+    """Write one timetable PNG per (name, sessions) student into a ZIP, rendering identical grids once
+
+    PNGs go into the archive as soon as they are rendered, so at most a few are held in memory.
+    """
+    entries = {}  # grid hash → tên tệp của các sinh viên có cùng lưới
+    jobs = []
+    empty = []
+    for position, (name, sessions) in enumerate(students, start=1):
+        grid = generate_timetable(sessions)
+        if grid.empty:
+            empty.append(name)
+            continue
+        grid_hash = hash_timetable_grid(grid, theme)
+        if grid_hash not in entries:
+            entries[grid_hash] = []
+            jobs.append((grid_hash, grid, theme))
+        entries[grid_hash].append(batch_entry_name(position, name))
+
+    images = 0
+    failed = []
+    # PNG đã được nén sẵn, nén lại bằng deflate gần như không giảm dung lượng
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for done, (grid_hash, png) in enumerate(iter_batch_renders(jobs, parallel), start=1):
+            if png is None:
+                failed += entries[grid_hash]
+            else:
+                for entry in entries[grid_hash]:
+                    archive.writestr(entry, png)
+                images += len(entries[grid_hash])
+            if on_progress:
+                on_progress(done, len(jobs))
+
+    return {
+        'students': len(students),
+        'images': images,
+        'renders': len(jobs),
+        'saved_renders': sum(len(names) for names in entries.values()) - len(jobs),
+        'empty': empty,
+        'failed': failed,
+    }
 
 # Định nghĩa ánh xạ giữa thời gian bắt đầu và kết thúc
 def get_time_mappings():
@@ -511,6 +1225,542 @@ def get_time_mappings():
     
     return start_times, end_times
 
+def _show_target_calc():
+    st.session_state.show_target_calc = True
+
+@st.fragment
+def target_gpa_section(gpa_10, gpa_4, total_credits, completed=frozenset()):
+    """Target GPA form; submitting it reruns only this fragment"""
+    # Toggle for target GPA calculation
+    st.button("Tính GPA mong ước", key="toggle_target_calc", on_click=_show_target_calc)
+    
+    # Show target GPA section if toggled
+    if st.session_state.show_target_calc:
+        try:
+            catalog = get_curriculum_catalog()
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            st.error(f"Không đọc được khung chương trình: {e}")
+            catalog = {'programs': {}, 'courses': {}}
+
+        # Chọn khung chương trình để tự điền số tín chỉ; mặc định vẫn là tự nhập
+        program_code = None
+        if catalog['programs']:
+            options = [None] + list(catalog['programs'])
+            program_code = st.selectbox(
+                "Khung chương trình đào tạo:", options, index=0,
+                format_func=lambda code: "Tự nhập số tín chỉ" if code is None
+                else f"{code} - {catalog['programs'][code]['name']}",
+                key="curriculum_program")
+
+        if program_code is not None:
+            remaining = remaining_courses(catalog, program_code, completed)
+            remaining_program_credits = float(remaining['Số TC'].sum())
+            st.write(f"Còn **{len(remaining)}** học phần trong khung chưa đạt "
+                     f"(**{remaining_program_credits:.0f}** tín chỉ).")
+            if not remaining.empty:
+                with st.expander("Các học phần còn lại"):
+                    st.dataframe(remaining, hide_index=True, use_container_width=True)
+
+        with st.form(key="target_gpa_form"):
+            st.write("**Tính GPA mong ước:**")
+            st.markdown("""
+            Nhập thông tin để tính điểm trung bình cần đạt cho các môn học còn lại 
+            để đạt được GPA mong muốn khi tốt nghiệp.
+            """)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if program_code is None:
+                    program_credits = st.number_input("Tổng số tín chỉ của khung chương trình:", 
+                                                    min_value=float(total_credits),
+                                                    value=float(max(DEFAULT_PROGRAM_CREDITS, total_credits)),
+                                                    step=1.0)
+                else:
+                    # Tín chỉ đã tích lũy cộng tín chỉ các học phần còn lại trong khung, đúng giá trị dùng để tính
+                    program_credits = float(total_credits) + remaining_program_credits
+                    st.number_input("Tổng số tín chỉ của khung chương trình:", value=program_credits, disabled=True,
+                                    help=f"{total_credits:.0f} tín chỉ đã tích lũy + {remaining_program_credits:.0f} "
+                                         f"tín chỉ các học phần còn lại (khung "
+                                         f"{catalog['programs'][program_code]['total_credits']:.0f} tín chỉ)")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                target_gpa_10 = st.number_input("GPA mong muốn (thang 10):", 
+                                             min_value=0.0, max_value=10.0, value=min(float(0), 10.0), step=0.1)
+            with col2:
+                target_gpa_4 = st.number_input("GPA mong muốn (thang 4):", 
+                                            min_value=0.0, max_value=4.0, value=min(float(0), 4.0), step=0.1)
+            
+            # Submit button for the form
+            submit_button = st.form_submit_button(label="Tính điểm cần đạt")
+            
+            if submit_button:
+                # Calculate required GPA for both scales
+                required_gpa_10, remaining_credits = calculate_required_gpa(
+                    gpa_10, total_credits, program_credits, target_gpa_10)
+                
+                required_gpa_4, _ = calculate_required_gpa(
+                    gpa_4, total_credits, program_credits, target_gpa_4)
+                
+                st.write("**Kết quả tính toán:**")
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    st.metric("Số tín chỉ còn lại", f"{remaining_credits:.0f}")
+                
+                with col2:
+                    if required_gpa_10 is not None:
+                        if required_gpa_10 > 10:
+                            st.error(f"Không thể đạt GPA {target_gpa_10:.1f}/10 với số tín chỉ còn lại")
+                        else:
+                            st.metric("Điểm trung bình cần đạt (thang 10)", f"{required_gpa_10:.1f}")
+                    else:
+                        st.info("Đã hoàn thành đủ tín chỉ")
+                
+                with col3:
+                    if required_gpa_4 is not None:
+                        if required_gpa_4 > 4:
+                            st.error(f"Không thể đạt GPA {target_gpa_4:.1f}/4 với số tín chỉ còn lại")
+                        else:
+                            st.metric("Điểm trung bình cần đạt (thang 4)", f"{required_gpa_4:.1f}")
+                    else:
+                        st.info("Đã hoàn thành đủ tín chỉ")
+                        
+                # Add interpretation
+                if required_gpa_10 is not None and required_gpa_4 is not None:
+                    st.write("**Giải thích:**")
+                    if required_gpa_10 <= 10 and required_gpa_4 <= 4:
+                        st.success(f"""
+                        Để đạt được GPA mong muốn khi tốt nghiệp, bạn cần đạt điểm trung bình 
+                        **{required_gpa_10:.1f}/10** (tương đương **{required_gpa_4:.1f}/4**) 
+                        cho **{remaining_credits:.0f}** tín chỉ còn lại.
+                        """)
+                        
+                        # Add classification for the required GPA
+                        required_classification = get_classification(required_gpa_4)
+                        st.info(f"Mức điểm này tương đương với xếp loại: **{required_classification}**")
+                    else:
+                        st.warning("""
+                        Mục tiêu GPA đặt ra quá cao so với GPA hiện tại và số tín chỉ còn lại.
+                        Hãy xem xét điều chỉnh mục tiêu GPA hoặc đăng ký thêm tín chỉ nếu có thể.
+                        """)
+
+def current_timetable_source():
+    """(cache key, text, file) of the timetable tab's input, or None when nothing was entered"""
+    timetable_file = st.session_state.get("timetable_file")
+    timetable_text = st.session_state.get("timetable_text", "")
+    # Tệp tải lên được theo dõi bằng hash nội dung thay vì giữ nội dung trong session state
+    if timetable_file is not None:
+        return hash_uploaded_file(timetable_file), None, timetable_file
+    if timetable_text:
+        return hash_pasted_text(timetable_text), timetable_text, None
+    return None
+
+def current_timetable_sessions():
+    source = current_timetable_source()
+    if source is None:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    return load_timetable_sessions(*source)
+
+def refresh_timetable():
+    """Regenerate the timetable once from the current inputs and render its PNG at most once"""
+    sessions = current_timetable_sessions()
+    validate_timetable_data(sessions)
+    timetable_table = generate_timetable(sessions, st.session_state.custom_courses)
+    st.session_state.timetable_df = timetable_table
+    st.session_state.png_data = None
+    if not timetable_table.empty:
+        st.session_state.png_data = export_table_to_png(timetable_table, st.session_state.current_theme)
+
+def _refresh_timetable_if_shown():
+    # Chỉ tự động cập nhật khi đã có thời khóa biểu hoặc dữ liệu đầu vào
+    if st.session_state.timetable_df is None and current_timetable_source() is None:
+        return
+    try:
+        refresh_timetable()
+    except Exception as e:
+        st.session_state.timetable_message = ("error", f"Lỗi khi cập nhật thời khóa biểu: {e}")
+
+def _on_theme_change():
+    st.session_state.current_theme = "light" if st.session_state.timetable_theme == "Light Mode" else "dark"
+    # Lưới thời khóa biểu không đổi, chỉ cần vẽ lại ảnh PNG
+    timetable_df = st.session_state.timetable_df
+    if timetable_df is not None and not timetable_df.empty:
+        st.session_state.png_data = export_table_to_png(timetable_df, st.session_state.current_theme)
+
+def _on_timetable_input_change():
+    # Nếu đã có thời khóa biểu, tự động tạo lại theo dữ liệu mới
+    if st.session_state.timetable_df is not None and current_timetable_source() is not None:
+        _refresh_timetable_if_shown()
+
+def _on_add_custom_course():
+    form_key = st.session_state.form_key
+    course_name = st.session_state[f"course_name_{form_key}"]
+    start_time = st.session_state[f"start_time_{form_key}"]
+    end_time = st.session_state[f"end_time_{form_key}"]
+    # Chuyển đổi giờ bắt đầu và kết thúc sang tiết học
+    period_start = time_to_period(*map(int, start_time.split(':')))
+    period_end = time_to_period(*map(int, end_time.split(':')))
+    if not course_name or period_start > period_end:
+        st.session_state.timetable_message = ("error", "Vui lòng nhập tên môn học và thời gian hợp lệ!")
+        return
+
+    st.session_state.custom_courses.append({
+        'course_name': course_name,
+        'room': st.session_state[f"room_{form_key}"],
+        'day': st.session_state[f"day_{form_key}"],
+        'period_start': period_start,
+        'period_end': period_end
+    })
+    # Tăng form_key để reset form
+    st.session_state.form_key += 1
+    st.session_state.timetable_message = ("success", f"Đã thêm môn học: {course_name}")
+    _refresh_timetable_if_shown()
+
+def _on_delete_custom_course(index):
+    st.session_state.custom_courses.pop(index)
+    _refresh_timetable_if_shown()
+
+def _on_clear_custom_courses():
+    st.session_state.custom_courses = []
+    _refresh_timetable_if_shown()
+
+def _on_generate_timetable():
+    if current_timetable_source() is None and not st.session_state.custom_courses:
+        st.session_state.timetable_message = (
+            "warning", "Vui lòng nhập dữ liệu thời khóa biểu hoặc thêm ít nhất một môn học tùy chỉnh!")
+        return
+    try:
+        refresh_timetable()
+    except Exception as e:
+        st.session_state.timetable_message = ("error", f"Có lỗi khi tạo thời khóa biểu: {e}")
+        return
+    if st.session_state.timetable_df.empty:
+        st.session_state.timetable_message = ("warning", "Không có lớp học nào được tìm thấy trong thời khóa biểu.")
+    else:
+        st.session_state.timetable_message = ("success", "Đã tạo thời khóa biểu thành công!")
+
+def custom_course_form():
+    with st.expander("Thêm môn học tùy chỉnh"):
+        st.markdown("Thêm các môn học không có trong dữ liệu thời khóa biểu.")
+        
+        # Lấy danh sách thời gian
+        start_times, end_times = get_time_mappings()
+        form_key = st.session_state.form_key
+        
+        # Sử dụng form_key để reset form sau khi thêm môn học
+        with st.form(f"custom_course_form_{form_key}"):
+            c1, c2 = st.columns(2)
+            with c1:
+                st.text_input("Tên môn học:", key=f"course_name_{form_key}")
+            with c2:
+                st.text_input("Phòng học:", key=f"room_{form_key}")
+            
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                st.selectbox("Thứ:", WEEKDAYS, key=f"day_{form_key}")
+            
+            # Tạo key duy nhất cho mỗi lần form được render
+            start_time_key = f"start_time_{form_key}"
+            end_time_key = f"end_time_{form_key}"
+            
+            # Lưu giá trị start_time vào session_state để sử dụng cho việc lọc end_time
+            if start_time_key not in st.session_state:
+                st.session_state[start_time_key] = start_times[0]
+            
+            with c2:
+                # Chọn giờ bắt đầu
+                start_time = st.selectbox("Giờ bắt đầu:", start_times, key=start_time_key)
+            
+            # Lọc danh sách thời gian kết thúc để chỉ hiển thị từ thời gian kết thúc của tiết bắt đầu trở đi
+            valid_end_times = end_times[start_times.index(start_time):]
+            
+            # Đảm bảo giá trị mặc định của end_time là hợp lệ
+            if end_time_key not in st.session_state or st.session_state[end_time_key] not in valid_end_times:
+                st.session_state[end_time_key] = valid_end_times[0]
+            
+            with c3:
+                # Chọn giờ kết thúc từ danh sách đã lọc
+                st.selectbox("Giờ kết thúc:", valid_end_times, key=end_time_key)
+            
+            st.form_submit_button("Thêm môn học", on_click=_on_add_custom_course)
+
+@st.fragment
+def timetable_view():
+    """Custom-course list, the generated timetable and its schedule views
+
+    Deleting a course reruns only this fragment; the schedule view is nested in it so it reruns too.
+    """
+    message = st.session_state.pop("timetable_message", None)
+    if message:
+        kind, text = message
+        getattr(st, kind)(text)
+    
+    # Display custom courses
+    if st.session_state.custom_courses:
+        st.write("**Các môn học đã thêm:**")
+        start_times, end_times = get_time_mappings()
+        for i, course in enumerate(st.session_state.custom_courses):
+            cols = st.columns([3, 1, 2, 1, 1])
+            with cols[0]:
+                st.write(f"{course['course_name']}")
+            with cols[1]:
+                st.write(f"{course['day']}")
+            with cols[2]:
+                # Hiển thị giờ học thay vì tiết
+                if 1 <= course['period_start'] <= 14 and 1 <= course['period_end'] <= 14:
+                    st.write(f"{start_times[course['period_start'] - 1]} - {end_times[course['period_end'] - 1]}")
+                else:
+                    st.write(f"Tiết {course['period_start']}-{course['period_end']}")
+            with cols[3]:
+                st.write(f"{course['room']}")
+            with cols[4]:
+                st.button("Xóa", key=f"delete_{i}", on_click=_on_delete_custom_course, args=(i,))
+        
+        st.button("Xóa tất cả môn học tùy chỉnh", on_click=_on_clear_custom_courses)
+    
+    st.button("Tạo thời khóa biểu", key="generate_timetable", on_click=_on_generate_timetable)
+    
+    timetable_df = st.session_state.timetable_df
+    if timetable_df is not None and not timetable_df.empty:
+        st.write("**Thời khóa biểu:**")
+        if st.session_state.png_data is not None:
+            # Display the PNG image
+            st.image(st.session_state.png_data, caption="Thời khóa biểu", use_container_width=True)
+            
+            # Add download button
+            st.download_button(
+                label="Tải ảnh PNG",
+                data=st.session_state.png_data,
+                file_name="timetable.png",
+                mime="image/png",
+                key="download_png"
+            )
+        else:
+            # Fall back to displaying the DataFrame if PNG generation fails
+            st.dataframe(timetable_df, use_container_width=True)
+    
+    # Lồng trong fragment này để xóa môn học tùy chỉnh cũng cập nhật lịch theo tuần và theo ngày
+    schedule_section()
+
+@st.fragment
+def schedule_section():
+    """Week and date views of the timetable over the semester calendar; nested in timetable_view"""
+    if current_timetable_source() is None and not st.session_state.custom_courses:
+        return
+    with st.expander("Lịch theo tuần và theo ngày"):
+        c1, c2 = st.columns(2)
+        with c1:
+            semester_start = st.date_input("Ngày bắt đầu học kỳ:", key="semester_start",
+                                           help="Tuần 1 là tuần (từ thứ 2) chứa ngày này; "
+                                                "các buổi học trước ngày bắt đầu không được tính.")
+        with c2:
+            n_weeks = int(st.number_input("Số tuần của học kỳ:", min_value=1, max_value=30, value=15,
+                                          step=1, key="semester_weeks"))
+        try:
+            sessions = pd.concat([current_timetable_sessions(),
+                                  custom_course_sessions(st.session_state.custom_courses)], ignore_index=True)
+            schedule = get_schedule_index(hash_sessions(sessions), semester_start, n_weeks, sessions)
+            
+            now = datetime.now()
+            upcoming = next_class(schedule, now)
+            if upcoming is not None:
+                st.info(f"Buổi học tiếp theo: **{upcoming['Tên lớp học phần']}** "
+                        f"({upcoming['Bắt đầu']:%H:%M %d/%m/%Y}, {upcoming['Phòng'] or 'chưa có phòng'})")
+            
+            current_week = min(max(week_of(schedule, now.date()), 1), n_weeks)
+            week = int(st.number_input("Tuần:", min_value=1, max_value=n_weeks, value=current_week,
+                                       step=1, key="selected_week"))
+            week_table = generate_timetable(week_sessions(schedule, week))
+            if week_table.empty:
+                st.write("Không có lớp học nào trong tuần này.")
+            else:
+                st.dataframe(week_table, use_container_width=True)
+            
+            selected_date = st.date_input("Xem lịch ngày:", value=now.date(), key="selected_date")
+            day_classes = classes_on_date(schedule, selected_date)
+            if day_classes.empty:
+                st.write("Không có lớp học nào trong ngày này.")
+            else:
+                st.dataframe(day_classes, hide_index=True, use_container_width=True)
+        except Exception as e:
+            st.error(f"Lỗi khi tạo lịch theo tuần: {e}")
+
+@st.fragment
+def timetable_tab():
+    """Timetable tab; its widgets rerun this fragment instead of the whole app"""
+    st.header("Chức năng Tạo thời khóa biểu")
+    st.markdown("""
+    **Hướng dẫn sử dụng:**
+    1. Copy bảng thời khóa biểu và dán vào ô bên dưới, hoặc tải lên tệp CSV/TSV/XLSX.
+    2. Nhấn nút "Tạo thời khóa biểu" để xem kết quả.
+    3. Bạn có thể thêm các môn học tùy chỉnh nếu cần.
+    """)
+    
+    # Theme selection (đặt ở đầu để có thể sử dụng cho tất cả các thao tác)
+    st.radio("Chọn kiểu giao diện xuất ảnh:", ["Light Mode", "Dark Mode"], horizontal=True,
+             key="timetable_theme", on_change=_on_theme_change)
+    
+    st.text_area("Nhập dữ liệu thời khóa biểu:", height=150, key="timetable_text",
+                 on_change=_on_timetable_input_change)
+    st.file_uploader("Hoặc tải lên tệp thời khóa biểu:", type=["csv", "tsv", "txt", "xlsx"],
+                     key="timetable_file", on_change=_on_timetable_input_change)
+    
+    custom_course_form()
+    timetable_view()
+
+def occupancy_tab():
+    st.header("Tra cứu phòng học và giảng viên")
+    st.markdown("""
+    **Hướng dẫn sử dụng:**
+    1. Tải lên thời khóa biểu của nhiều sinh viên (mỗi tệp một thời khóa biểu).
+    2. Tra cứu phòng trống theo thứ và tiết, hoặc xem lịch và số tiết mỗi tuần của từng phòng, giảng viên.
+    """)
+    files = st.file_uploader("Tải lên các tệp thời khóa biểu:", type=["csv", "tsv", "txt", "xlsx"],
+                             accept_multiple_files=True, key="faculty_files")
+    if not files:
+        return
+
+    try:
+        file_hashes = [hash_uploaded_file(f) for f in files]
+        rooms, lecturers = get_occupancy_indexes(combined_sources_key(file_hashes), list(zip(file_hashes, files)))
+    except Exception as e:
+        st.error(f"Có lỗi khi đọc thời khóa biểu: {e}")
+        return
+    st.write(f"Đã nạp {len(files)} thời khóa biểu, {len(rooms['keys'])} phòng và {len(lecturers['keys'])} giảng viên.")
+
+    st.subheader("Phòng trống")
+    c1, c2 = st.columns(2)
+    with c1:
+        day = st.selectbox("Thứ:", WEEKDAYS, key="free_room_day")
+    with c2:
+        period_start, period_end = st.slider("Tiết:", 1, PERIODS_PER_DAY, (1, 4), key="free_room_periods")
+    free = free_keys(rooms, WEEKDAYS.index(day), period_start, period_end)
+    st.write(f"**{len(free)}** phòng trống vào {day}, tiết {period_start}-{period_end}:")
+    st.write(", ".join(free) if len(free) else "Không có phòng nào trống.")
+
+    st.subheader("Lịch sử dụng")
+    c1, c2 = st.columns(2)
+    with c1:
+        room = st.selectbox("Phòng:", rooms['keys'], key="occupancy_room")
+    with c2:
+        lecturer = st.selectbox("Giảng viên:", lecturers['keys'], key="occupancy_lecturer")
+    loads = weekly_load(lecturers)
+    if room is not None:
+        st.write(f"**Phòng {room}:**")
+        st.dataframe(mask_to_grid(rooms['masks'][rooms['positions'][room]], "Có lớp"), use_container_width=True)
+    if lecturer is not None:
+        st.metric(f"Số tiết mỗi tuần của {lecturer}", int(loads[lecturer]))
+        st.dataframe(mask_to_grid(lecturers['masks'][lecturers['positions'][lecturer]], "Có lớp"),
+                     use_container_width=True)
+    with st.expander("Số tiết mỗi tuần của tất cả giảng viên"):
+        st.dataframe(loads.sort_values(ascending=False), use_container_width=True)
+
+def group_tab():
+    st.header("Tìm giờ rảnh chung của nhóm")
+    st.markdown("""
+    **Hướng dẫn sử dụng:**
+    1. Tải lên thời khóa biểu của các thành viên (mỗi tệp một người), hoặc dán nhiều thời khóa biểu
+       vào ô bên dưới, ngăn cách nhau bằng một dòng `---`.
+    2. Chọn số thành viên tối thiểu cần rảnh để xem các khoảng thời gian phù hợp, dài nhất trước.
+    """)
+    files = st.file_uploader("Tải lên các tệp thời khóa biểu:", type=["csv", "tsv", "txt", "xlsx"],
+                             accept_multiple_files=True, key="group_files")
+    pasted = st.text_area("Hoặc dán thời khóa biểu của các thành viên:", height=150, key="group_text")
+    include_mine = st.checkbox("Thêm thời khóa biểu của tôi (kể cả môn học tùy chỉnh)", key="group_include_mine")
+
+    sources = [(hash_uploaded_file(f), None, f) for f in files or []]
+    sources += [(hash_pasted_text(text), text, None) for text in split_pasted_timetables(pasted)]
+    # Thời khóa biểu của tôi lấy từ tab "Tạo thời khóa biểu"
+    own_source = current_timetable_source() if include_mine else None
+    has_own = include_mine and (own_source is not None or bool(st.session_state.custom_courses))
+    if not sources and not has_own:
+        return
+
+    try:
+        # Ma trận được cache chỉ gồm các thành viên khác (khóa không phụ thuộc thứ tự nguồn);
+        # dòng của tôi luôn được tính riêng và nối vào cuối
+        busy = get_group_busy_masks(combined_sources_key([key for key, _, _ in sources]), sources)
+        if has_own:
+            own_sessions = [custom_course_sessions(st.session_state.custom_courses)]
+            if own_source is not None:
+                own_sessions.insert(0, load_timetable_sessions(*own_source))
+            busy = np.vstack([busy, group_busy_masks([pd.concat(own_sessions, ignore_index=True)])])
+    except Exception as e:
+        st.error(f"Có lỗi khi đọc thời khóa biểu: {e}")
+        return
+
+    n_members = len(busy)
+    free_counts = group_free_counts(busy)
+    st.write(f"Đã nạp thời khóa biểu của **{n_members}** thành viên.")
+    min_free = n_members
+    if n_members > 1:
+        min_free = st.slider("Số thành viên rảnh tối thiểu:", 1, n_members, n_members, key="group_min_free")
+
+    blocks = rank_free_blocks(free_counts, min_free)
+    if blocks.empty:
+        st.warning("Không có khoảng thời gian nào phù hợp.")
+    else:
+        st.write("**Các khoảng thời gian rảnh (dài nhất trước):**")
+        st.dataframe(blocks, hide_index=True, use_container_width=True)
+
+    with st.expander("Số thành viên rảnh theo từng tiết"):
+        start_times, end_times = get_time_mappings()
+        st.dataframe(pd.DataFrame(free_counts.T, index=[f"{s} → {e}" for s, e in zip(start_times, end_times)],
+                                  columns=WEEKDAYS), use_container_width=True)
+
+@st.fragment
+def batch_tab():
+    """Class-wide timetable images; reruns only this fragment"""
+    st.header("Tạo ảnh thời khóa biểu cho cả lớp")
+    st.markdown("""
+    **Hướng dẫn sử dụng:**
+    1. Tải lên thời khóa biểu của từng sinh viên (mỗi tệp một người, tên tệp là tên ảnh), hoặc dán nhiều
+       thời khóa biểu vào ô bên dưới, ngăn cách nhau bằng một dòng `---`.
+    2. Nhấn "Tạo ảnh hàng loạt" để nhận một tệp ZIP gồm ảnh thời khóa biểu của mỗi sinh viên.
+       Các sinh viên có lịch học giống nhau dùng chung một lần vẽ.
+    """)
+    st.radio("Chọn kiểu giao diện xuất ảnh:", ["Light Mode", "Dark Mode"], horizontal=True, key="batch_theme")
+    files = st.file_uploader("Tải lên các tệp thời khóa biểu:", type=["csv", "tsv", "txt", "xlsx"],
+                             accept_multiple_files=True, key="batch_files")
+    pasted = st.text_area("Hoặc dán thời khóa biểu của các sinh viên:", height=150, key="batch_text")
+
+    sources = [(f.name, (hash_uploaded_file(f), None, f)) for f in files or []]
+    sources += [(f"sinh_vien_{i}", (hash_pasted_text(text), text, None))
+                for i, text in enumerate(split_pasted_timetables(pasted), start=1)]
+
+    if st.button("Tạo ảnh hàng loạt", key="generate_batch", disabled=not sources):
+        theme = "light" if st.session_state.batch_theme == "Light Mode" else "dark"
+        progress = st.progress(0.0, text="Đang vẽ thời khóa biểu...")
+        started = time.perf_counter()
+        try:
+            students = [(name, load_timetable_sessions(*source)) for name, source in sources]
+            # Mỗi phiên giữ một tệp ZIP tạm, xóa tệp cũ trước khi tạo tệp mới
+            zip_path = new_batch_zip_path(st.session_state.get("batch_zip_path"))
+            report = build_batch_zip(students, zip_path, theme,
+                                     on_progress=lambda done, total: progress.progress(done / total))
+            report['elapsed'] = time.perf_counter() - started
+            st.session_state.batch_zip_path = zip_path
+            st.session_state.batch_report = report
+        except Exception as e:
+            st.error(f"Có lỗi khi tạo ảnh hàng loạt: {e}")
+        finally:
+            progress.empty()
+
+    report = st.session_state.get("batch_report")
+    zip_path = st.session_state.get("batch_zip_path")
+    if not report or not zip_path or not os.path.exists(zip_path):
+        return
+    st.success(f"Đã tạo {report['images']} ảnh cho {report['students']} sinh viên trong {report['elapsed']:.1f} giây, "
+               f"chỉ cần vẽ {report['renders']} lần (lịch trùng nhau giúp bỏ qua {report['saved_renders']} lần vẽ).")
+    if report['empty']:
+        st.warning(f"Không có buổi học nào trong thời khóa biểu của: {', '.join(report['empty'])}")
+    if report['failed']:
+        st.error(f"Không vẽ được ảnh: {', '.join(report['failed'])}")
+    with open(zip_path, "rb") as f:
+        st.download_button("Tải xuống tệp ZIP", f, file_name="thoi_khoa_bieu_ca_lop.zip",
+                           mime="application/zip", key="download_batch_zip")
+
 def main():
     st.title("Ứng dụng Tính điểm học tập và Tạo thời khóa biểu")
     
@@ -533,38 +1783,41 @@ def main():
         st.session_state.current_theme = "light"
     if "last_custom_courses_hash" not in st.session_state:
         st.session_state.last_custom_courses_hash = hash(str(st.session_state.custom_courses))
-    if "timetable_input" not in st.session_state:
-        st.session_state.timetable_input = ""
     if "form_key" not in st.session_state:
         st.session_state.form_key = 0  # Sử dụng để reset form
     
-    tabs = st.tabs(["Tính điểm", "Tạo thời khóa biểu"])
+    tabs = st.tabs(["Tính điểm", "Tạo thời khóa biểu", "Phòng học và giảng viên", "Giờ rảnh của nhóm",
+                    "Ảnh thời khóa biểu cả lớp"])
     
     with tabs[0]:
         st.header("Chức năng Tính điểm")
         st.markdown("""
         **Hướng dẫn sử dụng:**
-        1. Copy toàn bộ bảng điểm và dán vào ô bên dưới.
+        1. Copy toàn bộ bảng điểm và dán vào ô bên dưới, hoặc tải lên tệp CSV/TSV/XLSX.
         2. Nhấn nút "Tính điểm" để xem chi tiết bảng điểm và kết quả tổng hợp.
         """)
-        input_text = st.text_area("Nhập dữ liệu điểm:", height=150)
+        input_text = st.text_area("Nhập dữ liệu điểm:", height=150, key="transcript_text")
+        transcript_file = st.file_uploader("Hoặc tải lên tệp bảng điểm:", type=["csv", "tsv", "txt", "xlsx"],
+                                           key="transcript_file")
+        grade_scale = st.selectbox("Thang quy đổi điểm:", list(GRADE_SCALES),
+                                   index=list(GRADE_SCALES).index(DEFAULT_GRADE_SCALE),
+                                   help="Dùng để điền thang 4 và thang chữ cho các môn chỉ có điểm thang 10")
     
         # Button to calculate GPA
         if st.button("Tính điểm", key="calculate_score"):
-            if input_text:
+            if input_text or transcript_file is not None:
                 try:
-                    df = parse_input_data(input_text)
-    
-                    gpa_10, gpa_4, classification, total_credits = calculate_gpa(df)
+                    if transcript_file is not None:
+                        df = load_transcript_upload(hash_uploaded_file(transcript_file), transcript_file, grade_scale)
+                    else:
+                        df = parse_input_data(input_text, grade_scale)
                     
-                    # Store results in session state
+                    # Store results in session state; GPA is computed from the index on display
                     st.session_state.calculated_gpa = True
                     st.session_state.gpa_data = {
                         "df": df,
-                        "gpa_10": gpa_10,
-                        "gpa_4": gpa_4,
-                        "classification": classification,
-                        "total_credits": total_credits
+                        "course_index": build_course_index(df),
+                        "hash": hash_transcript(df)
                     }
                 except Exception as e:
                     st.error(f"Có lỗi xảy ra khi xử lý dữ liệu: {e}")
@@ -574,10 +1827,12 @@ def main():
         # Display GPA results if calculated
         if st.session_state.calculated_gpa and st.session_state.gpa_data:
             df = st.session_state.gpa_data["df"]
-            gpa_10 = st.session_state.gpa_data["gpa_10"]
-            gpa_4 = st.session_state.gpa_data["gpa_4"]
-            classification = st.session_state.gpa_data["classification"]
-            total_credits = st.session_state.gpa_data["total_credits"]
+            course_index = st.session_state.gpa_data["course_index"]
+            
+            retake_label = st.radio("Cách tính môn học lại:", list(RETAKE_POLICIES), horizontal=True,
+                                    key="retake_policy")
+            retake_policy = RETAKE_POLICIES[retake_label]
+            gpa_10, gpa_4, classification, total_credits = calculate_gpa(df, retake_policy, course_index)
             
             st.write("**Bảng điểm chi tiết:**")
             display_df = df.copy()
@@ -587,6 +1842,16 @@ def main():
 
             st.dataframe(display_df.set_index('STT'), use_container_width=True)
             
+            skipped = int((~retake_mask(df, retake_policy, course_index)).sum())
+            if skipped:
+                st.caption(f"Có {skipped} lần học lại không được tính vào điểm trung bình.")
+            
+            with st.expander("Tra cứu học phần"):
+                course_code = st.selectbox("Mã học phần:", sorted(course_index['by_course']), key="lookup_course")
+                if course_code:
+                    st.dataframe(lookup_course(display_df, course_index, course_code).set_index('STT'),
+                                 use_container_width=True)
+            
             st.write("**Kết quả tổng hợp:**")
             col1, col2, col3, col4 = st.columns(4)
             with col1:
@@ -597,373 +1862,31 @@ def main():
                 st.metric("Xếp loại", classification)
             with col4:
                 st.metric("Tổng số tín chỉ", f"{total_credits:.0f}")
-            # Toggle for target GPA calculation
-            if st.button("Tính GPA mong ước", key="toggle_target_calc"):
-                st.session_state.show_target_calc = True
             
-            # Show target GPA section if toggled
-            if st.session_state.show_target_calc:
-                with st.form(key="target_gpa_form"):
-                    st.write("**Tính GPA mong ước:**")
-                    st.markdown("""
-                    Nhập thông tin để tính điểm trung bình cần đạt cho các môn học còn lại 
-                    để đạt được GPA mong muốn khi tốt nghiệp.
-                    """)
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        program_credits = st.number_input("Tổng số tín chỉ của khung chương trình:", 
-                                                        min_value=float(total_credits), value=float(180), step=1.0)
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        target_gpa_10 = st.number_input("GPA mong muốn (thang 10):", 
-                                                     min_value=0.0, max_value=10.0, value=min(float(0), 10.0), step=0.1)
-                    with col2:
-                        target_gpa_4 = st.number_input("GPA mong muốn (thang 4):", 
-                                                    min_value=0.0, max_value=4.0, value=min(float(0), 4.0), step=0.1)
-                    
-                    # Submit button for the form
-                    submit_button = st.form_submit_button(label="Tính điểm cần đạt")
-                    
-                    if submit_button:
-                        # Calculate required GPA for both scales
-                        required_gpa_10, remaining_credits = calculate_required_gpa(
-                            gpa_10, total_credits, program_credits, target_gpa_10)
-                        
-                        required_gpa_4, _ = calculate_required_gpa(
-                            gpa_4, total_credits, program_credits, target_gpa_4)
-                        
-                        st.write("**Kết quả tính toán:**")
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            st.metric("Số tín chỉ còn lại", f"{remaining_credits:.0f}")
-                        
-                        with col2:
-                            if required_gpa_10 is not None:
-                                if required_gpa_10 > 10:
-                                    st.error(f"Không thể đạt GPA {target_gpa_10:.1f}/10 với số tín chỉ còn lại")
-                                else:
-                                    st.metric("Điểm trung bình cần đạt (thang 10)", f"{required_gpa_10:.1f}")
-                            else:
-                                st.info("Đã hoàn thành đủ tín chỉ")
-                        
-                        with col3:
-                            if required_gpa_4 is not None:
-                                if required_gpa_4 > 4:
-                                    st.error(f"Không thể đạt GPA {target_gpa_4:.1f}/4 với số tín chỉ còn lại")
-                                else:
-                                    st.metric("Điểm trung bình cần đạt (thang 4)", f"{required_gpa_4:.1f}")
-                            else:
-                                st.info("Đã hoàn thành đủ tín chỉ")
-                                
-                        # Add interpretation
-                        if required_gpa_10 is not None and required_gpa_4 is not None:
-                            st.write("**Giải thích:**")
-                            if required_gpa_10 <= 10 and required_gpa_4 <= 4:
-                                st.success(f"""
-                                Để đạt được GPA mong muốn khi tốt nghiệp, bạn cần đạt điểm trung bình 
-                                **{required_gpa_10:.1f}/10** (tương đương **{required_gpa_4:.1f}/4**) 
-                                cho **{remaining_credits:.0f}** tín chỉ còn lại.
-                                """)
-                                
-                                # Add classification for the required GPA
-                                required_classification = get_classification(required_gpa_4)
-                                st.info(f"Mức điểm này tương đương với xếp loại: **{required_classification}**")
-                            else:
-                                st.warning("""
-                                Mục tiêu GPA đặt ra quá cao so với GPA hiện tại và số tín chỉ còn lại.
-                                Hãy xem xét điều chỉnh mục tiêu GPA hoặc đăng ký thêm tín chỉ nếu có thể.
-                                """)
+            timeline = get_gpa_timeline(st.session_state.gpa_data["hash"], retake_policy, df, course_index)
+            if not timeline.empty:
+                st.write("**Điểm trung bình theo học kỳ:**")
+                st.dataframe(timeline, use_container_width=True)
+                scale_label = st.radio("Thang điểm của biểu đồ:", ["Thang 4", "Thang 10"], horizontal=True,
+                                       key="timeline_scale")
+                # Đánh số thứ tự để biểu đồ giữ đúng thứ tự học kỳ thay vì sắp xếp theo chữ cái
+                chart_df = timeline[[f"GPA kỳ ({scale_label})", f"GPA tích lũy ({scale_label})"]]
+                chart_df.index = [f"{i:02d} · {semester}" for i, semester in enumerate(chart_df.index, start=1)]
+                st.line_chart(chart_df)
+            
+            target_gpa_section(gpa_10, gpa_4, total_credits, completed_course_stems(df, course_index))
     
     with tabs[1]:
-        st.header("Chức năng Tạo thời khóa biểu")
-        st.markdown("""
-        **Hướng dẫn sử dụng:**
-        1. Copy bảng thời khóa biểu và dán vào ô bên dưới.
-        2. Nhấn nút "Tạo thời khóa biểu" để xem kết quả.
-        3. Bạn có thể thêm các môn học tùy chỉnh nếu cần.
-        """)
-        
-        # Theme selection (đặt ở đầu để có thể sử dụng cho tất cả các thao tác)
-        theme = st.radio("Chọn kiểu giao diện xuất ảnh:", ["Light Mode", "Dark Mode"], horizontal=True)
-        selected_theme = "light" if theme == "Light Mode" else "dark"
-        
-        # Cập nhật theme nếu có thay đổi
-        if selected_theme != st.session_state.current_theme:
-            st.session_state.current_theme = selected_theme
-            # Tự động tạo lại ảnh PNG nếu đã có thời khóa biểu
-            if st.session_state.timetable_df is not None and not st.session_state.timetable_df.empty:
-                try:
-                    png_bytes = export_table_to_png(st.session_state.timetable_df, selected_theme)
-                    if png_bytes:
-                        st.session_state.png_data = png_bytes
-                        st.rerun()  # Rerun để hiển thị ảnh mới
-                except Exception as e:
-                    st.error(f"Lỗi khi tạo ảnh PNG: {str(e)}")
-        
-        # Lưu dữ liệu thời khóa biểu vào session state để theo dõi thay đổi
-        timetable_input = st.text_area("Nhập dữ liệu thời khóa biểu:", height=150)
-        
-        # Kiểm tra nếu dữ liệu đầu vào thay đổi
-        if timetable_input != st.session_state.timetable_input:
-            st.session_state.timetable_input = timetable_input
-            # Nếu đã có dữ liệu mới và có dữ liệu cũ, tự động tạo lại thời khóa biểu
-            if timetable_input and st.session_state.timetable_df is not None:
-                try:
-                    tt_df = parse_timetable_data(timetable_input)
-                    validate_timetable_data(tt_df)
-                    timetable_table = generate_timetable(tt_df, st.session_state.custom_courses)
-                    st.session_state.timetable_df = timetable_table
-                    
-                    # Tạo lại ảnh PNG với theme hiện tại
-                    png_bytes = export_table_to_png(timetable_table, st.session_state.current_theme)
-                    if png_bytes:
-                        st.session_state.png_data = png_bytes
-                except Exception:
-                    # Bỏ qua lỗi, sẽ xử lý khi người dùng bấm nút tạo thời khóa biểu
-                    pass
-
-        # Custom course addition
-        with st.expander("Thêm môn học tùy chỉnh"):
-            st.markdown("Thêm các môn học không có trong dữ liệu thời khóa biểu.")
-            
-            # Lấy danh sách thời gian
-            start_times, end_times = get_time_mappings()
-            
-            # Sử dụng form_key để reset form sau khi thêm môn học
-            with st.form(f"custom_course_form_{st.session_state.form_key}"):
-                c1, c2 = st.columns(2)
-                with c1:
-                    course_name = st.text_input("Tên môn học:")
-                with c2:
-                    room = st.text_input("Phòng học:")
-                
-                c1, c2, c3 = st.columns(3)
-                with c1:
-                    day = st.selectbox("Thứ:", ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "CN"])
-                
-                # Tạo key duy nhất cho mỗi lần form được render
-                start_time_key = f"start_time_{st.session_state.form_key}"
-                end_time_key = f"end_time_{st.session_state.form_key}"
-                
-                # Lưu giá trị start_time vào session_state để sử dụng cho việc lọc end_time
-                if start_time_key not in st.session_state:
-                    st.session_state[start_time_key] = start_times[0]
-                
-                with c2:
-                    # Chọn giờ bắt đầu
-                    start_time = st.selectbox(
-                        "Giờ bắt đầu:", 
-                        start_times,
-                        key=start_time_key
-                    )
-                    
-                    # Chuyển đổi sang tiết học
-                    hour, minute = map(int, start_time.split(':'))
-                    period_start = time_to_period(hour, minute)
-                
-                # Lấy index của thời gian bắt đầu trong danh sách
-                start_index = start_times.index(start_time)
-                
-                # Lọc danh sách thời gian kết thúc để chỉ hiển thị từ thời gian kết thúc của tiết bắt đầu trở đi
-                valid_end_times = end_times[start_index:]
-                
-                # Đảm bảo giá trị mặc định của end_time là hợp lệ
-                if end_time_key not in st.session_state or st.session_state[end_time_key] not in valid_end_times:
-                    st.session_state[end_time_key] = valid_end_times[0]
-                
-                with c3:
-                    # Chọn giờ kết thúc từ danh sách đã lọc
-                    end_time = st.selectbox(
-                        "Giờ kết thúc:", 
-                        valid_end_times,
-                        key=end_time_key
-                    )
-                    
-                    # Chuyển đổi sang tiết học
-                    hour, minute = map(int, end_time.split(':'))
-                    period_end = time_to_period(hour, minute)
-                
-                submit_custom = st.form_submit_button("Thêm môn học")
-                
-                if submit_custom:
-                    if course_name and period_start <= period_end:
-                        new_course = {
-                            'course_name': course_name,
-                            'room': room,
-                            'day': day,
-                            'period_start': period_start,
-                            'period_end': period_end
-                        }
-                        st.session_state.custom_courses.append(new_course)
-                        
-                        # Tự động cập nhật thời khóa biểu nếu đã có dữ liệu
-                        if st.session_state.timetable_df is not None or timetable_input:
-                            try:
-                                # Tạo DataFrame từ dữ liệu hiện có
-                                if timetable_input:
-                                    tt_df = parse_timetable_data(timetable_input)
-                                else:
-                                    tt_df = pd.DataFrame(columns=['Tên lớp học phần', 'Thời gian', 'Phòng'])
-                                
-                                # Tạo lại thời khóa biểu
-                                timetable_table = generate_timetable(tt_df, st.session_state.custom_courses)
-                                st.session_state.timetable_df = timetable_table
-                                
-                                # Tạo lại ảnh PNG với theme hiện tại
-                                png_bytes = export_table_to_png(timetable_table, st.session_state.current_theme)
-                                if png_bytes:
-                                    st.session_state.png_data = png_bytes
-                                
-                                # Thông báo thành công
-                                st.success(f"Đã thêm môn học: {course_name}")
-                                
-                                # Tăng form_key để reset form
-                                st.session_state.form_key += 1
-                                
-                                # Rerun để hiển thị thời khóa biểu mới và reset form
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Lỗi khi cập nhật thời khóa biểu: {e}")
-                        else:
-                            # Nếu chưa có thời khóa biểu
-                            st.success(f"Đã thêm môn học: {course_name}")
-                            # Tăng form_key để reset form
-                            st.session_state.form_key += 1
-                            st.rerun()
-                    else:
-                        st.error("Vui lòng nhập tên môn học và thời gian hợp lệ!")
-        
-        # Display custom courses
-        if st.session_state.custom_courses:
-            st.write("**Các môn học đã thêm:**")
-            custom_courses_changed = False
-            
-            for i, course in enumerate(st.session_state.custom_courses):
-                cols = st.columns([3, 1, 2, 1, 1])
-                with cols[0]:
-                    st.write(f"{course['course_name']}")
-                with cols[1]:
-                    st.write(f"{course['day']}")
-                with cols[2]:
-                    # Hiển thị giờ học thay vì tiết
-                    period_to_time_map = {
-                        1: "07:00-07:50", 2: "08:00-08:50", 3: "09:00-09:50",
-                        4: "10:00-10:50", 5: "11:00-11:50", 6: "12:30-13:20",
-                        7: "13:30-14:20", 8: "14:30-15:20", 9: "15:30-16:20",
-                        10: "16:30-17:20", 11: "17:30-18:15", 12: "18:15-19:00",
-                        13: "19:10-19:55", 14: "19:55-20:40"
-                    }
-                    start_time = period_to_time_map.get(course['period_start'], "")
-                    end_time = period_to_time_map.get(course['period_end'], "")
-                    if start_time and end_time:
-                        start_hour = start_time.split('-')[0]
-                        end_hour = end_time.split('-')[1]
-                        st.write(f"{start_hour} - {end_hour}")
-                    else:
-                        st.write(f"Tiết {course['period_start']}-{course['period_end']}")
-                with cols[3]:
-                    st.write(f"{course['room']}")
-                with cols[4]:
-                    if st.button("Xóa", key=f"delete_{i}"):
-                        st.session_state.custom_courses.pop(i)
-                        custom_courses_changed = True
-                        break  # Dừng vòng lặp sau khi xóa để tránh lỗi index
-            
-            if st.button("Xóa tất cả môn học tùy chỉnh"):
-                st.session_state.custom_courses = []
-                custom_courses_changed = True
-            
-            # Nếu có thay đổi trong danh sách môn học tùy chỉnh, cập nhật thời khóa biểu
-            if custom_courses_changed:
-                try:
-                    # Tạo DataFrame từ dữ liệu hiện có
-                    if timetable_input:
-                        tt_df = parse_timetable_data(timetable_input)
-                    else:
-                        tt_df = pd.DataFrame(columns=['Tên lớp học phần', 'Thời gian', 'Phòng'])
-                    
-                    # Tạo lại thời khóa biểu
-                    timetable_table = generate_timetable(tt_df, st.session_state.custom_courses)
-                    st.session_state.timetable_df = timetable_table
-                    
-                    # Tạo lại ảnh PNG với theme hiện tại
-                    png_bytes = export_table_to_png(timetable_table, st.session_state.current_theme)
-                    if png_bytes:
-                        st.session_state.png_data = png_bytes
-                    
-                    # Rerun để hiển thị thời khóa biểu mới
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Lỗi khi cập nhật thời khóa biểu: {e}")
-
-        if st.button("Tạo thời khóa biểu", key="generate_timetable"):
-            if timetable_input or st.session_state.custom_courses:
-                try:
-                    if timetable_input:
-                        tt_df = parse_timetable_data(timetable_input)
-                        validate_timetable_data(tt_df)
-                    else:
-                        # Create an empty DataFrame if only custom courses are provided
-                        tt_df = pd.DataFrame(columns=['Tên lớp học phần', 'Thời gian', 'Phòng'])
-                    
-                    # Generate timetable with custom courses
-                    timetable_table = generate_timetable(tt_df, st.session_state.custom_courses)
-
-                    # Store in session state
-                    st.session_state.timetable_df = timetable_table
-                    
-                    # Kiểm tra nếu timetable trống
-                    if timetable_table.empty:
-                        st.warning("Không có lớp học nào được tìm thấy trong thời khóa biểu.")
-                    else:
-                        # Generate PNG immediately with current theme
-                        try:
-                            png_bytes = export_table_to_png(timetable_table, st.session_state.current_theme)
-                            if png_bytes:
-                                st.session_state.png_data = png_bytes
-                                
-                                # Display success message
-                                st.success("Đã tạo thời khóa biểu thành công!")
-                                
-                                # Show PNG image
-                                st.image(png_bytes, caption="Thời khóa biểu", use_container_width=True)
-                                
-                                # Add download button
-                                st.download_button(
-                                    label="Tải ảnh PNG",
-                                    data=png_bytes,
-                                    file_name="timetable.png",
-                                    mime="image/png",
-                                    key="download_png"
-                                )
-                        except Exception as e:
-                            st.error(f"Lỗi khi tạo ảnh PNG: {str(e)}")
-                            # Fall back to displaying the DataFrame if PNG generation fails
-                            st.dataframe(timetable_table, use_container_width=True)
-
-                except Exception as e:
-                    st.error(f"Có lỗi khi tạo thời khóa biểu: {e}")
-            else:
-                st.warning("Vui lòng nhập dữ liệu thời khóa biểu hoặc thêm ít nhất một môn học tùy chỉnh!")
+        timetable_tab()
+    
+    with tabs[2]:
+        occupancy_tab()
+    
+    with tabs[3]:
+        group_tab()
 
-        # Display existing PNG if available but no new timetable was generated
-        elif st.session_state.timetable_df is not None and st.session_state.png_data is not None:
-            st.write("**Thời khóa biểu:**")
-            
-            # Display the PNG image
-            st.image(st.session_state.png_data, caption="Thời khóa biểu", use_container_width=True)
-            
-            # Add download button
-            st.download_button(
-                label="Tải ảnh PNG",
-                data=st.session_state.png_data,
-                file_name="timetable.png",
-                mime="image/png",
-                key="download_png"
-            )
+    with tabs[4]:
+        batch_tab()
 
 if __name__ == "__main__":
     main()
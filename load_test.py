@@ -0,0 +1,363 @@
+"""Offline load test for app.py: N concurrent simulated browser sessions against one `streamlit run` server.
+
+Usage:
+    python load_test.py --sessions 20 --concurrency 8
+
+The harness starts app.py with `streamlit run` on a free local port and drives it over the same
+websocket protocol the browser uses, so every session shares one server process, its caches and
+its render queue. Each session pastes a synthetic transcript and clicks "Tính điểm", opens
+"Tính GPA mong ước", pastes a synthetic timetable, generates it, adds custom courses, toggles the
+theme and downloads the PNG from the download button's media URL. Widgets inside fragments rerun
+only their fragment, as they do in the browser.
+
+The report shows p50/p95/p99 latency of the successful runs of each action (one rerun, or the
+HTTP download), the error count and first error message per action, the server's RSS after
+start-up and after --warmup sessions (reported separately from the steady-state growth per
+measured session), and the app's own render queue gauges (renders in progress, batch render
+futures pending) read from the JSON file the app writes to RENDER_STATS_PATH.
+A session stops at its first failed action, so one failure is not reported again by later steps.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+WEEKDAYS = ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7"]
+
+def synthetic_transcript(rng, n_rows):
+    """Tab-separated transcript in the layout parse_input_data expects"""
+    lines = []
+    for i in range(n_rows):
+        semester = f"{i // 8 % 2 + 1}/{2021 + i // 16}-{2022 + i // 16}"
+        score = round(rng.uniform(3.0, 10.0), 1)
+        # Một số môn chỉ có điểm thang 10, giống bảng điểm xuất thiếu cột
+        letter_cols = ["", "", ""] if rng.random() < 0.3 else [f"{score}", "3.0", "B"]
+        lines.append("\t".join([
+            str(i + 1), semester, "", f"INT{1000 + rng.randrange(n_rows)} {rng.randrange(1, 4)}",
+            f"Học phần {i}", str(rng.choice([2, 3, 4])), "BT*0.2+GK*0.3+CK*0.5",
+            "8", "7", "9", "", "", *letter_cols,
+        ]))
+    return "\n".join(lines)
+
+def synthetic_timetable(rng, n_courses):
+    """Tab-separated timetable in the layout parse_timetable_data expects"""
+    lines = []
+    for i in range(n_courses):
+        sessions = []
+        for _ in range(rng.choice([1, 2])):
+            start = rng.randrange(1, 12)
+            sessions.append(f"{rng.choice(WEEKDAYS)},{start}-{start + rng.randrange(1, 3)},P{rng.randrange(100, 500)}")
+        lines.append("\t".join([
+            str(i + 1), f"MAT{1000 + i}", f"Môn học {i}", "", "", "",
+            f"Giảng viên {rng.randrange(20)}", ", ".join(sessions),
+        ]))
+    lines.append("Tổng cộng:\t\t\t\t\t\t\t")
+    return "\n".join(lines)
+
+def process_rss_mb(pid):
+    """Resident set size of a process in MB"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Không có /proc (ví dụ macOS): hỏi ps
+    return int(subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout) / 1024
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    return process_rss_mb(os.getpid())
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port, stats_path, log, timeout):
+    """Start app.py under `streamlit run` and wait until its health endpoint answers"""
+    env = dict(os.environ, RENDER_STATS_PATH=stats_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true",
+         "--server.address", "127.0.0.1", "--server.port", str(port),
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {server.returncode}, see {log.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).ok:
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"streamlit did not start within {timeout}s, see {log.name}")
+
+def read_render_stats(path):
+    """Latest render queue snapshot written by the app, or an empty one before the first render"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"elapsed": 0.0, "gauges": {}}
+
+class BrowserSession:
+    """One simulated browser tab: sends reruns with its widget values and keeps the latest elements"""
+
+    def __init__(self, ws, base_url, timeout):
+        self.ws = ws
+        self.base_url = base_url
+        self.timeout = timeout
+        self.values = {}    # widget id → WidgetState gửi kèm mỗi lần chạy lại, như trình duyệt
+        self.widgets = {}   # user key (hoặc nhãn nút submit) → (widget id, element, fragment id)
+
+    def _add_element(self, element, fragment_id, errors):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            errors.append(f"{element.exception.type}: {element.exception.message}")
+        elif kind == "alert" and element.alert.format == Alert.ERROR:
+            errors.append(element.alert.body)
+        widget_id = getattr(getattr(element, kind), "id", "") if kind else ""
+        if widget_id.startswith("$$ID-"):
+            # Dạng "$$ID-<hash>-<key>"; nút submit của form dùng "FormSubmitter:<form>-<nhãn>"
+            key = widget_id.split("-", 2)[2]
+            if key.startswith("FormSubmitter:"):
+                key = key.split("-", 1)[1]
+            self.widgets[key] = (widget_id, getattr(element, kind), fragment_id)
+
+    def rerun(self, trigger=None, fragment_id=""):
+        """Send one rerun (optionally clicking the `trigger` button) and wait for the script to finish"""
+        msg = BackMsg()
+        msg.rerun_script.fragment_id = fragment_id
+        widgets = msg.rerun_script.widget_states.widgets
+        for state in self.values.values():
+            widgets.add().CopyFrom(state)
+        if trigger:
+            widgets.add(id=trigger, trigger_value=True)
+        self.ws.send(msg.SerializeToString())
+
+        errors = []
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(self.ws.recv(timeout=self.timeout))
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                self._add_element(fwd.delta.new_element, fwd.delta.fragment_id, errors)
+            elif kind == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    errors.append("script failed to compile")
+                # st.rerun() kết thúc lượt chạy sớm, lượt chạy tiếp theo sẽ gửi script_finished riêng
+                if fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        if errors:
+            raise RuntimeError(errors[0])
+
+    def widget(self, key):
+        if key not in self.widgets:
+            raise LookupError(f"no widget {key!r} on the page")
+        return self.widgets[key]
+
+    def set_value(self, key, field, value):
+        """Change a widget's value without rerunning; returns its fragment id"""
+        widget_id, _, fragment_id = self.widget(key)
+        state = WidgetState(id=widget_id)
+        setattr(state, field, value)
+        self.values[widget_id] = state
+        return fragment_id
+
+    def edit(self, key, field, value):
+        """Change a widget's value and rerun, as committing an input does in the browser"""
+        self.rerun(fragment_id=self.set_value(key, field, value))
+
+    def click(self, key):
+        widget_id, _, fragment_id = self.widget(key)
+        self.rerun(trigger=widget_id, fragment_id=fragment_id)
+
+    def download(self, key):
+        """Fetch a download button's file from the server's media endpoint"""
+        _, button, _ = self.widget(key)
+        if not button.url:
+            raise RuntimeError(f"download button {key!r} has no file")
+        response = requests.get(self.base_url + button.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+class Recorder:
+    """Latency and error store shared by the session threads"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.first_errors = {}
+
+    def timed(self, action, fn):
+        """Run one action; only successful runs are added to the latency stats. Returns success"""
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            self.errors[action] += 1
+            self.first_errors.setdefault(action, f"{type(e).__name__}: {e}")
+            return False
+        self.latencies[action].append(time.perf_counter() - start)
+        return True
+
+def run_session(recorder, seed, args):
+    rng = random.Random(seed)
+    transcript = synthetic_transcript(rng, args.rows)
+    timetable = synthetic_timetable(rng, args.courses)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    with connect(f"ws://127.0.0.1:{args.port}/_stcore/stream", subprotocols=["streamlit"],
+                 max_size=None, open_timeout=args.timeout) as ws:
+        tab = BrowserSession(ws, base_url, args.timeout)
+        if not recorder.timed("load", tab.rerun):
+            return
+
+        def calculate():
+            tab.set_value("transcript_text", "string_value", transcript)
+            tab.click("calculate_score")
+        steps = [
+            ("calculate_gpa", calculate),
+            ("open_target_gpa", lambda: tab.click("toggle_target_calc")),
+            ("paste_timetable", lambda: tab.edit("timetable_text", "string_value", timetable)),
+            ("generate_timetable", lambda: tab.click("generate_timetable")),
+        ]
+
+        for i in range(args.custom_courses):
+            def add_course(i=i):
+                # Khóa của form đổi sau mỗi lần thêm, nên tìm ô nhập theo tiền tố khóa
+                name_key = max((k for k in tab.widgets if k.startswith("course_name_")),
+                               key=lambda k: int(k.rsplit("_", 1)[1]))
+                form_key = name_key.rsplit("_", 1)[1]
+                tab.set_value(name_key, "string_value", f"CLB {i}")
+                tab.set_value(f"day_{form_key}", "string_value", rng.choice(WEEKDAYS))
+                tab.click("Thêm môn học")
+            steps.append(("add_custom_course", add_course))
+        steps.append(("toggle_theme", lambda: tab.edit("timetable_theme", "string_value", "Dark Mode")))
+
+        def download():
+            if not tab.download("download_png").startswith(b"\x89PNG"):
+                raise RuntimeError("downloaded file is not a PNG")
+        steps.append(("download_png", download))
+
+        for action, fn in steps:
+            if not recorder.timed(action, fn):
+                return
+
+def run_sessions(recorder, seeds, args):
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda seed: run_session(recorder, seed, args), seeds))
+
+def percentiles(values):
+    if not values:
+        return {"n": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"n": len(values), "p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1)}
+
+def queue_report(before, after, window):
+    """Per-gauge peak, entries and mean depth over the measured window, from two app snapshots"""
+    report = {}
+    for name, gauge in after["gauges"].items():
+        start = before["gauges"].get(name, {"entered": 0, "area": 0.0})
+        report[name] = {
+            "max": gauge["max"],
+            "entered": gauge["entered"] - start["entered"],
+            "mean_depth": round((gauge["area"] - start["area"]) / window, 3) if window else None,
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=10, help="number of measured sessions")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions running at the same time")
+    parser.add_argument("--warmup", type=int, default=1, help="sessions run first and left out of the latency stats")
+    parser.add_argument("--rows", type=int, default=60, help="transcript rows per session")
+    parser.add_argument("--courses", type=int, default=10, help="timetable courses per session")
+    parser.add_argument("--custom-courses", type=int, default=2, help="custom courses added per session")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per rerun")
+    parser.add_argument("--port", type=int, default=0, help="server port (default: a free one)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    args.port = args.port or free_port()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    stats_path = os.path.join(workdir, "render_stats.json")
+    with open(os.path.join(workdir, "server.log"), "w") as log:
+        server = start_server(args.port, stats_path, log, args.timeout)
+        try:
+            rss_started = process_rss_mb(server.pid)
+            run_sessions(Recorder(), [args.seed - i - 1 for i in range(args.warmup)], args)
+            rss_warm = process_rss_mb(server.pid)
+            stats_warm = read_render_stats(stats_path)
+
+            recorder = Recorder()
+            started = time.perf_counter()
+            run_sessions(recorder, [args.seed + i for i in range(args.sessions)], args)
+            wall = time.perf_counter() - started
+            rss_end = process_rss_mb(server.pid)
+            stats_end = read_render_stats(stats_path)
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    errors = recorder.errors
+    report = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "warmup_sessions": args.warmup,
+        "wall_s": round(wall, 2),
+        "actions": {action: percentiles(recorder.latencies[action])
+                    for action in dict.fromkeys([*recorder.latencies, *errors])},
+        "errors": dict(errors),
+        "first_errors": recorder.first_errors,
+        "server_rss_mb": {"started": round(rss_started, 1), "after_warmup": round(rss_warm, 1),
+                          "end": round(rss_end, 1)},
+        "warmup_rss_growth_mb": round(rss_warm - rss_started, 1),
+        "rss_growth_per_session_mb": round((rss_end - rss_warm) / max(args.sessions, 1), 2),
+        "render_queue": queue_report(stats_warm, stats_end, wall),
+        "server_log": log.name,
+    }
+
+    print(f"{args.sessions} sessions after {args.warmup} warm-up, concurrency {args.concurrency}, {wall:.1f}s")
+    print(f"{'action':<20}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for action, stats in report["actions"].items():
+        print(f"{action:<20}{stats['n']:>6}{stats['p50_ms']!s:>10}{stats['p95_ms']!s:>10}{stats['p99_ms']!s:>10}"
+              f"{errors.get(action, 0):>8}")
+    print(f"server RSS {rss_started:.0f} MB at start, +{report['warmup_rss_growth_mb']} MB warm-up, "
+          f"then {report['rss_growth_per_session_mb']} MB per session ({rss_end:.0f} MB at the end)")
+    for name, gauge in report["render_queue"].items():
+        print(f"render queue {name}: mean depth {gauge['mean_depth']}, max {gauge['max']}, "
+              f"{gauge['entered']} entered")
+    for action, message in recorder.first_errors.items():
+        print(f"first error in {action}: {message}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()